@@ -40,6 +40,9 @@ def main():
     sys.argv.pop(0)
     normalize = False
     proposals = False
+    statistics = False
+    propose_format = False
+    kwargs = {}
     while sys.argv and sys.argv[0][0] == '-':
         if sys.argv[0] == '-k':
             for kw, desc in sorted(KEYWORDS.items()):
@@ -51,6 +54,32 @@ def main():
         if sys.argv[0] == '-p':
             proposals = not proposals
             sys.argv.pop(0)
+        if sys.argv[0] == '-a':
+            kwargs["wav_analysis"] = not kwargs.get("wav_analysis")
+            sys.argv.pop(0)
+        if sys.argv[0] == '-b':
+            # Not imported at the top, only needed for this
+            from ddhf_bitstore_metadata.formats.bagit import BAGIT_LEVELS  # pylint: disable=import-outside-toplevel
+            sys.argv.pop(0)
+            kwargs["bagit_level"] = sys.argv.pop(0) if sys.argv else None
+            if kwargs["bagit_level"] not in BAGIT_LEVELS:
+                print("-b LEVEL must be one of", ", ".join(BAGIT_LEVELS), file=sys.stderr)
+                sys.exit(2)
+        if sys.argv[0] == '-f':
+            propose_format = not propose_format
+            sys.argv.pop(0)
+        if sys.argv[0] == '-i':
+            kwargs["save_index"] = not kwargs.get("save_index")
+            sys.argv.pop(0)
+        if sys.argv[0] == '-m':
+            sys.argv.pop(0)
+            kwargs["cache_bagit_manifest"] = sys.argv.pop(0)
+        if sys.argv[0] == '-r':
+            kwargs["bagit_nested"] = not kwargs.get("bagit_nested")
+            sys.argv.pop(0)
+        if sys.argv[0] == '-s':
+            statistics = not statistics
+            sys.argv.pop(0)
 
     exit_status = 0
     for filename in sys.argv:
@@ -81,18 +110,22 @@ def main():
         if filename[-5:] == ".meta":
             expected_artifact = filename[:-5]
             try:
-                file = open(expected_artifact, "rb")
                 i = internals.Artifact(mdi)
-                i.open_artifact(file)
+                i.open_file(expected_artifact)
                 mdi.add_accessor(i)
                 if bitstore and bitstore.Size.val is None:
                     bitstore.Size.val = str(i.length)
+                if propose_format and bitstore and bitstore.Format.val is None:
+                    candidates = i.sniff()
+                    if candidates:
+                        bitstore.Format.val = candidates[0][1]
+                        bitstore.Format.mandatory = False
             except FileNotFoundError:
                 pass
 
         mdi.allow_keyword_proposals(proposals)
 
-        for err in mdi.litany():
+        for err in mdi.litany(**kwargs):
             if not mentioned:
                 print(filename, "=>", err.kind)
                 mentioned = True
@@ -116,6 +149,12 @@ def main():
             else:
                 print(filename, "=> OK\n\tArtifact not checked")
 
+        if statistics and mdi.artifact:
+            for name, stats in mdi.artifact.statistics.items():
+                print("\t" + name + ":", ", ".join("%s=%s" % i for i in stats.items()))
+
+        mdi.close()
+
     sys.exit(exit_status)
 
 main()
@@ -33,9 +33,17 @@
 '''
 
 import os
+import time
+import zlib
 import hashlib
+import zipfile
+import concurrent.futures
 
 from ..internals.fileformatclass import FileFormat, FileFormatError
+from ..internals import manifest_index
+from ..internals.artifact import Artifact, read_full
+from ..internals.file_formats import FileFormats, SNIFF_HEAD, SNIFF_TAIL
+from ..internals.metadata import MemberMetadata
 
 def validate_bagit_txt(lines, vfilename, *_args):
     ''' ... '''
@@ -63,83 +71,339 @@ def validate_bagit_txt(lines, vfilename, *_args):
         yield FileFormatError("Bad 'Tag-File-Character-Encoding:' in " + vfilename)
         return
 
-def validate_manifest(lines, vfilename, files):
+def validate_bag_info(lines, vfilename, info):
     ''' ... '''
+    label = None
+    for i in lines:
+        if i[:1].isspace() and label:
+            info[label] += " " + i.strip()
+            continue
+        j = i.split(":", 1)
+        if len(j) != 2:
+            yield FileFormatError("Syntax error in " + vfilename)
+            return
+        label = j[0]
+        info[label] = j[1].strip()
+
+def validate_manifest(lines, vfilename, files, algorithm):
+    ''' ... '''
+    width = hashlib.new(algorithm).digest_size * 2
     for line in lines:
         flds = line.split(maxsplit=1)
-        if len(flds[0]) != 64:
+        if len(flds) != 2 or len(flds[0]) != width:
             yield FileFormatError("Format error (bad digest) in " + vfilename)
             return
-        files[flds[1]] = flds[0]
+        files.setdefault(flds[1], {})[algorithm] = flds[0].lower()
+
+CHUNK_SIZE = 1 << 20
+
+# Manifest algorithms we understand, sha256 is mandatory
+MANIFEST_ALGORITHMS = ("md5", "sha1", "sha256", "sha512")
+
+# Verification levels, cheapest first:
+#   structure:  tag files, manifests and payload listing from the central directory
+#   crc:        also stream payload members and check their zip CRC32
+#   full:       also stream payload members and check all their manifest digests
+BAGIT_LEVELS = ("structure", "crc", "full")
+
+# Payload members are not validated as these
+NOT_NESTED = ("BAGIT", "BINARY")
+
+class DigestingReader():
+    ''' Reader which feeds everything read to the CRC32 or the hashers '''
+
+    def __init__(self, file, level, algorithms):
+        self.file = file
+        self.level = level
+        self.crc = 0
+        self.hashers = []
+        if level == "full":
+            self.hashers = [hashlib.new(alg) for alg in algorithms]
+
+    def close(self):
+        ''' The member is closed by check_member(), after it is drained '''
+
+    def read(self, size=-1):
+        ''' Read and digest '''
+        buf = self.file.read(size)
+        if self.level == "crc":
+            self.crc = zlib.crc32(buf, self.crc)
+        for hasher in self.hashers:
+            hasher.update(buf)
+        return buf
+
+def member_ends(artifact, zinfo):
+    ''' What the probes get to see of a member, only the head of compressed ones '''
+    if zinfo.compress_type == zipfile.ZIP_STORED:
+        start, end = artifact.zipdir.data_span(zinfo)
+        return FileFormats.ends(memoryview(artifact.buffer())[start:end])
+    with artifact.open_member(zinfo) as file:
+        head = read_full(file, SNIFF_HEAD)
+    if zinfo.file_size > len(head):
+        return head, b'', zinfo.file_size
+    return head, head[-SNIFF_TAIL:], len(head)
+
+def member_format(artifact, zinfo):
+    '''
+       The format to validate a payload member as: the best of those
+       using its extension which its signature agrees with, otherwise
+       whatever its signature says, if it says so clearly.
+    '''
+    if zinfo.flag_bits & 0x1:
+        return None
+    try:
+        ends = member_ends(artifact, zinfo)
+    except (zipfile.BadZipFile, zlib.error, NotImplementedError):
+        # The CRC or digest check will complain
+        return None
+    extension = os.path.splitext(zinfo.filename)[1][1:].lower()
+    best_score, best = 0, None
+    for fmt in FileFormats.with_extension(extension):
+        score = FileFormats.get(fmt).probe(*ends) if fmt not in NOT_NESTED else 0
+        if score > best_score:
+            best_score, best = score, fmt
+    if best:
+        return best
+    for score, fmt in FileFormats.sniff_ends(ends):
+        if score >= 80 and fmt not in NOT_NESTED:
+            return fmt
+    return None
+
+def validate_member(artifact, zinfo, fmt, reader):
+    '''
+       Validate a payload member as fmt, stored members in place,
+       others streamed through the reader which digests them.
+    '''
+    mdi = MemberMetadata(zinfo.filename, fmt, zinfo.file_size)
+    try:
+        with Artifact(mdi) as member:
+            if zinfo.compress_type == zipfile.ZIP_STORED:
+                member.open_zip_member(artifact, zinfo)
+            else:
+                member.open_stream(reader, zinfo.file_size)
+            mdi.add_accessor(member)
+            return [
+                FileFormatError(zinfo.filename + ": " + err.text)
+                for err in FileFormats.get(fmt)(mdi).litany()
+            ]
+    except Exception as err:
+        # One broken member must not stop the others from being checked
+        return [FileFormatError(zinfo.filename + ": %s crashed: %s" % (fmt, repr(err)))]
+
+def check_member(artifact, zinfo, chunk_size, level, algorithms=("sha256",), nested=None):
+    '''
+       CRC32 ("crc") or {algorithm: hexdigest} ("full") of a member,
+       read in chunks through its own reader, all hashers fed from
+       the same chunk.
+
+       If nested names a format, the member is also validated as
+       that, from the same read where it has to be streamed.
+
+       Returns the check and a list of complaints.
+    '''
+    complaints = []
+    with artifact.open_member(zinfo) as file:
+        reader = DigestingReader(file, level, algorithms)
+        if nested:
+            complaints = validate_member(artifact, zinfo, nested, reader)
+        if level != "structure":
+            # Whatever the validator did not read
+            while reader.read(chunk_size):
+                continue
+    if level == "crc":
+        return reader.crc, complaints
+    return dict((alg, hasher.hexdigest()) for alg, hasher in zip(algorithms, reader.hashers)), complaints
 
 class BagIt(FileFormat):
     ''' ... '''
 
     EXTENSION = "zip"
 
-    def validate(self, cache_bagit_manifest=False, **kwargs):
+    @classmethod
+    def probe(cls, head, tail, length):
+        if head[:4] != b'PK\x03\x04':
+            return 0
+        if b'/bagit.txt' in head or b'/bagit.txt' in tail:
+            return 90
+        return 20
+
+    def validate(
+        self,
+        cache_bagit_manifest=False,
+        bagit_threads=None,
+        bagit_chunk_size=CHUNK_SIZE,
+        bagit_level="full",
+        bagit_nested=False,
+        **kwargs
+    ):
         yield from super().validate(**kwargs)
+        if bagit_level not in BAGIT_LEVELS:
+            yield FileFormatError("Unknown BagIt verification level '%s'" % str(bagit_level))
+            return
         try:
             self.mdi.artifact.open_bagit()
         except Exception as err:
             yield FileFormatError(str(err))
             return
 
-        zfil = self.mdi.artifact.zipfile
+        zdir = self.mdi.artifact.zipdir
 
         dname = self.mdi.BitStore.Filename.val
         assert dname[-4:].lower() == ".zip"
         dname = dname[:-4] + '/'
-        try:
-            _info = zfil.getinfo(dname + "bagit.txt")
-        except KeyError:
+        if dname + "bagit.txt" not in zdir:
             yield FileFormatError("'" + dname + "bagit.txt' not found")
             return
 
+        bag_info = {}
         expected_files = {}
-        for mfn, validator in (
-            ("bagit.txt", validate_bagit_txt),
-            ("bag-info.txt", None),
-            ("manifest-sha256.txt", validate_manifest),
-        ):
-            try:
-                _info = zfil.getinfo(dname + mfn)
-            except KeyError:
+        expected_tags = {}
+        tag_files = [
+            ("bagit.txt", validate_bagit_txt, ()),
+            ("bag-info.txt", validate_bag_info, (bag_info,)),
+            ("manifest-sha256.txt", validate_manifest, (expected_files, "sha256")),
+        ]
+        for alg in MANIFEST_ALGORITHMS:
+            mfn = "manifest-" + alg + ".txt"
+            if alg != "sha256" and dname + mfn in zdir:
+                tag_files.append((mfn, validate_manifest, (expected_files, alg)))
+        for alg in MANIFEST_ALGORITHMS:
+            mfn = "tagmanifest-" + alg + ".txt"
+            if dname + mfn in zdir:
+                tag_files.append((mfn, validate_manifest, (expected_tags, alg)))
+
+        algorithms = set()
+        for mfn, validator, args in tag_files:
+            if dname + mfn not in zdir:
                 yield FileFormatError("Bagit lacks '" + dname + mfn + "'")
-            if validator:
-                with zfil.open(dname + mfn, "r") as vfil:
-                    try:
-                        lines = vfil.read().decode("utf8").splitlines()
-                    except Exception as err:
-                        print("ERR", err)
-                        yield FileFormatError("Format error in " + dname + mfn)
-                        return
-                    yield from validator(lines, dname + mfn, expected_files)
-
-        if cache_bagit_manifest:
-            ident = self.mdi.BitStore.Ident.val.split(":")[0]
-            os.makedirs("_bagit_manifest", exist_ok=True)
-            with open(os.path.join("_bagit_manifest", ident + ".sha256"), "w") as file:
-                for i, j in expected_files.items():
-                    file.write(" ".join((j, ident, i)) + "\n")
+                continue
+            if args and args[0] is expected_files:
+                algorithms.add(args[1])
+            with self.mdi.artifact.open_member(zdir[dname + mfn]) as vfil:
+                try:
+                    lines = vfil.read().decode("utf8").splitlines()
+                except Exception:
+                    yield FileFormatError("Format error in " + dname + mfn)
+                    return
+                yield from validator(lines, dname + mfn, *args)
+
+        for rfn, digests in expected_files.items():
+            for alg in sorted(algorithms - set(digests)):
+                yield FileFormatError("File '" + rfn + " not in manifest-" + alg + ".txt")
+
+        for rfn, digests in expected_tags.items():
+            if dname + rfn not in zdir:
+                yield FileFormatError("Tag file '" + rfn + " only in tag manifest")
+                continue
+            check, _complaints = check_member(
+                self.mdi.artifact,
+                zdir[dname + rfn],
+                bagit_chunk_size,
+                "full",
+                list(digests),
+            )
+            for alg, digest in sorted(digests.items()):
+                if check[alg] != digest:
+                    yield FileFormatError(
+                        "Tag file '" + rfn + " wrong " + alg + " digest: " + check[alg]
+                    )
 
         pfx = dname + "data/"
         lpfx = len(pfx)
-        for zfi in zfil.infolist():
-            if zfi.is_dir():
+        payload = []
+        for zfi in zdir.entries(pfx):
+            if zfi.is_dir() or len(zfi.filename) == lpfx:
                 continue
-            zfn = zfi.filename
-            if zfn[:lpfx] != pfx or len(zfn) == lpfx:
+            payload.append(zfi)
+
+        # Payload-Oxum is a cheap pre-filter before we read any payload
+        oxum = bag_info.get("Payload-Oxum")
+        if oxum is not None:
+            octets, _dot, streams = oxum.partition(".")
+            if not octets.isdigit() or not streams.isdigit():
+                yield FileFormatError("Bad 'Payload-Oxum:' in " + dname + "bag-info.txt")
+            else:
+                have = sum(zfi.file_size for zfi in payload)
+                if int(octets) != have or int(streams) != len(payload):
+                    yield FileFormatError(
+                        "Payload-Oxum mismatch (%s != %d.%d)" % (oxum, have, len(payload))
+                    )
+                    return
+
+        members = []
+        not_in_manifest = []
+        for zfi in payload:
+            rfn = zfi.filename[len(dname):]
+            digests = expected_files.get(rfn)
+            if not digests:
+                not_in_manifest.append(rfn)
                 continue
-            rfn = zfn[len(dname):]
-            digest = expected_files.get(rfn)
-            if not digest:
-                yield FileFormatError("File '" + rfn + " not in manifest")
-                return
             del expected_files[rfn]
-            sha256 = hashlib.sha256()
-            sha256.update(zfil.read(zfn))
-            if sha256.hexdigest() != digest:
-                yield FileFormatError("File '" + zfn + " wrong digest: " + sha256.hexdigest())
+            members.append((zfi, digests))
+
+        nested = {}
+        if bagit_nested:
+            for zfi, _digests in members:
+                fmt = member_format(self.mdi.artifact, zfi)
+                if fmt:
+                    nested[zfi.filename] = fmt
+
+        # Memory use is bounded by chunk_size * threads
+        t0 = time.monotonic()
+        if bagit_level != "structure":
+            checked = members
+        else:
+            checked = [(zfi, digests) for zfi, digests in members if zfi.filename in nested]
+        with concurrent.futures.ThreadPoolExecutor(bagit_threads) as pool:
+            checks = list(pool.map(
+                lambda zfi: check_member(
+                    self.mdi.artifact,
+                    zfi,
+                    bagit_chunk_size,
+                    bagit_level,
+                    sorted(algorithms),
+                    nested.get(zfi.filename),
+                ),
+                [zfi for zfi, _digests in checked],
+            ))
+        dt = time.monotonic() - t0
+        verified = []
+        for (zfi, digests), (check, complaints) in zip(checked, checks):
+            yield from complaints
+            if bagit_level == "structure":
+                continue
+            if bagit_level == "crc":
+                if check != zfi.CRC:
+                    yield FileFormatError("File '" + zfi.filename + " wrong CRC32: %08x" % check)
+                continue
+            for alg, digest in sorted(digests.items()):
+                if check[alg] != digest:
+                    yield FileFormatError(
+                        "File '" + zfi.filename + " wrong " + alg + " digest: " + check[alg]
+                    )
+            if "sha256" in digests and check.get("sha256") == digests["sha256"]:
+                verified.append((zfi.filename[len(dname):], check["sha256"], zfi.file_size))
+
+        # Only digests we have verified go in the index, so only at level "full"
+        ident = self.mdi.BitStore.Ident.val
+        if cache_bagit_manifest and bagit_level == "full" and ident:
+            if cache_bagit_manifest is True:
+                cache_bagit_manifest = manifest_index.DEFAULT_FILENAME
+            with manifest_index.ManifestIndex(cache_bagit_manifest) as index:
+                index.update(ident.split(":")[0], verified)
+
+        octets = sum(zfi.file_size for zfi, _digests in checked)
+        self.mdi.artifact.statistics["bagit"] = {
+            "level": bagit_level,
+            "members": len(members),
+            "octets": octets,
+            "seconds": round(dt, 3),
+            "MB/s": round(octets / (dt * 1e6), 1) if dt else None,
+            "validated": len(nested),
+            "sha256 verified": len(verified),
+        }
+
+        for rfn in not_in_manifest:
+            yield FileFormatError("File '" + rfn + " not in manifest")
         for rfn in expected_files:
             yield FileFormatError("File '" + rfn + " only in manifest")
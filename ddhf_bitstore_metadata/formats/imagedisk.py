@@ -32,52 +32,212 @@
     ================
 '''
 
+import os
+import re
+import struct
+import hashlib
+
 from ..internals.fileformatclass import FileFormat, FileFormatError
+from ..internals.arrayindex import ArrayIndex
+from ..sections.media import ParseGeometry, GeometryException
+
+TRACK_HEADER = struct.Struct("<5B")
+
+RAW_CACHE_DIR = "_imagedisk_raw"
+
+class TrackIndex(ArrayIndex):
+    '''
+       Compact index of the track records in an ImageDisk file
+
+       Track n has sectors track_first[n] … track_first[n] + track_nsect[n] - 1
+       in the sector arrays.  sector_offset is the offset of the sector record,
+       the sector data (or fill byte, for compressed sectors) follows the state.
+    '''
+
+    MAGIC = b'IMDX\x02\x00\x00\x00'
+
+    ARRAYS = (
+        ("track_offset", "Q"),
+        ("track_first", "I"),
+        ("track_cyl", "B"),
+        ("track_head", "B"),
+        ("track_nsect", "B"),
+        ("track_sectsize", "B"),
+        ("sector_offset", "Q"),
+        ("sector_num", "B"),
+        ("sector_state", "B"),
+    )
+
+    def __len__(self):
+        return len(self.track_offset)
+
+    def __iter__(self):
+        ''' Yield (cyl, head, sector length, [(sector number, state, offset), …]) '''
+        for trk in range(len(self)):
+            first = self.track_first[trk]
+            last = first + self.track_nsect[trk]
+            yield (
+                self.track_cyl[trk],
+                self.track_head[trk],
+                128 << self.track_sectsize[trk],
+                list(zip(
+                    self.sector_num[first:last],
+                    self.sector_state[first:last],
+                    self.sector_offset[first:last],
+                )),
+            )
+
+    def geometry(self):
+        '''
+           Derive a Media.Geometry description of the tracks
+
+           Returns None if it cannot be expressed, because a track
+           occurs more than once or has non-consecutive sector numbers.
+           Tracks without sectors are ignored.
+        '''
+        tracks = {}
+        for trk in range(len(self)):
+            first = self.track_first[trk]
+            nums = sorted(self.sector_num[first:first + self.track_nsect[trk]])
+            if not nums:
+                continue
+            key = (self.track_cyl[trk], self.track_head[trk])
+            if key in tracks or nums[-1] - nums[0] != len(nums) - 1:
+                return None
+            tracks[key] = (nums[0], nums[-1], 128 << self.track_sectsize[trk])
+
+        # Zones are runs of cylinders with identical per-head layout
+        zones = []
+        for (cyl, head), shape in sorted(tracks.items()):
+            if zones and zones[-1][1] == cyl:
+                zones[-1][2].append((head,) + shape)
+            else:
+                zones.append([cyl, cyl, [(head,) + shape]])
+        merged = []
+        for cyl, _cyl, heads in zones:
+            hds = [x[0] for x in heads]
+            if len(set(x[1:] for x in heads)) == 1 and hds[-1] - hds[0] == len(hds) - 1:
+                parts = [(hds[0], hds[-1]) + heads[0][1:]]
+            else:
+                parts = [(x[0], x[0]) + x[1:] for x in heads]
+            if merged and merged[-1][1] == cyl - 1 and merged[-1][2] == parts:
+                merged[-1][1] = cyl
+            else:
+                merged.append([cyl, cyl, parts])
+
+        text = []
+        next_cyl = 0
+        for cyl0, cyl1, parts in merged:
+            for head0, head1, sec0, sec1, seclen in parts:
+                words = []
+                if len(parts) > 1 or cyl0 != next_cyl:
+                    words.append("%d…%dc" % (cyl0, cyl1))
+                elif cyl1 > cyl0:
+                    words.append("%dc" % (cyl1 - cyl0 + 1))
+                if head0:
+                    words.append("%d…%dh" % (head0, head1))
+                elif head1:
+                    words.append("%dh" % (head1 + 1))
+                if sec0 == 1:
+                    words.append("%ds" % sec1)
+                else:
+                    words.append("%d…%ds" % (sec0, sec1))
+                words.append("%db" % seclen)
+                text.append(" ".join(words))
+                next_cyl = cyl1 + 1
+        return ", ".join(text)
+
+    def decode(self, octets, file):
+        ''' Write the raw image to file, in cylinder, head, sector order '''
+        for _cyl, _head, seclen, sectors in sorted(self, key=lambda x: x[:2]):
+            for _num, state, offset in sorted(sectors):
+                if not state:
+                    file.write(bytes(seclen))
+                elif state & 1:
+                    file.write(octets[offset + 1:offset + 1 + seclen])
+                else:
+                    file.write(octets[offset + 1:offset + 2] * seclen)
 
 class ImageDisk(FileFormat):
     ''' ... '''
 
     EXTENSION = "imd"
+    ACCESS = "sequential"
+
+    @classmethod
+    def probe(cls, head, tail, length):
+        return 100 if head[:4] == b'IMD ' else 0
 
-    def validate(self, **kwargs):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.index = None
+
+    def validate(self, save_index=False, **kwargs):
         yield from super().validate(**kwargs)
         self.need(4)
         if self.octets[:4] != b'IMD ':
             yield FileFormatError("No 'IMD ' magic marker")
             return
-        ptr = self.octets.find(b'\x1a')
+        # The artifact may be any buffer, memoryviews have no find()
+        eoh = re.compile(b'\x1a').search(self.octets)
+        ptr = eoh.start() if eoh else -1
         if ptr < 4:
             yield FileFormatError("0x1A byte found")
             return
         try:
-            _header = self.octets[:ptr].decode('ascii')
+            _header = bytes(self.octets[:ptr]).decode('ascii')
         except UnicodeDecodeError:
             yield FileFormatError("Illegal chars in header text")
             return
 
-        ptr += 1
-        ntracks = 0
+        index = TrackIndex()
+        with memoryview(self.octets) as octets:
+            for err in self.walk_tracks(octets, ptr + 1, index):
+                yield err
+                return
+        self.index = index
+        self.mdi.artifact.index = index
+        if save_index:
+            self.mdi.artifact.save_index()
+
+        geometry = index.geometry()
+        self.mdi.artifact.statistics["imagedisk"] = {
+            "tracks": len(index),
+            "sectors": len(index.sector_offset),
+            "geometry": geometry,
+        }
+        media = getattr(self.mdi, "Media", None)
+        if media and media.Geometry.val:
+            if geometry is None:
+                yield FileFormatError("ImageDisk geometry cannot be expressed as Media.Geometry")
+                return
+            try:
+                declared = set(ParseGeometry(media.Geometry.val))
+            except GeometryException:
+                # Media.Geometry complains about this
+                return
+            if set(ParseGeometry(geometry)) != declared:
+                yield FileFormatError(
+                    "ImageDisk geometry (%s) disagrees with Media.Geometry" % geometry
+                )
 
-        while ptr < len(self.octets):
-            ntracks += 1
+    def walk_tracks(self, octets, ptr, index):
+        ''' Walk the track records '''
+        length = len(octets)
+        while ptr < length:
+            self.need(ptr + TRACK_HEADER.size)
+            track_offset = ptr
+            track_mode, cyl, head, nsect, sectsize = TRACK_HEADER.unpack_from(octets, ptr)
+            ptr += TRACK_HEADER.size
 
-            self.need(ptr + 1)
-            track_mode = self.octets[ptr]
-            ptr += 1
             if track_mode > 0x5:
                 yield FileFormatError("Illegal track mode (0x%x)" % track_mode)
                 return
 
-            self.need(ptr + 1)
-            cyl = self.octets[ptr]
-            ptr += 1
             if cyl > 90:
                 yield FileFormatError("Illegal cylinder (0x%x)" % cyl)
                 return
 
-            self.need(ptr + 1)
-            head = self.octets[ptr]
-            ptr += 1
             cylmap = head & 0x80
             headmap = head & 0x40
             head &= 0x3f
@@ -85,48 +245,76 @@ class ImageDisk(FileFormat):
                 yield FileFormatError("Illegal head (0x%x)" % head)
                 return
 
-            self.need(ptr + 1)
-            nsect = self.octets[ptr]
-            ptr += 1
             if nsect > 50:
                 yield FileFormatError("Illegal sector count (0x%x)" % nsect)
                 return
 
-            self.need(ptr + 1)
-            sectsize = self.octets[ptr]
-            ptr += 1
             if sectsize > 0x6:
                 yield FileFormatError("Illegal sector size (0x%x)" % sectsize)
                 return
 
+            # Skip the optional cylinder and head maps.  (Can we check them ?)
             self.need(ptr + nsect)
-            _sec_num_map = self.octets[ptr:ptr + nsect]
+            sec_num_map = octets[ptr:ptr + nsect]
             ptr += nsect
-            # can we check sec_num_map ?
-
             if cylmap:
-                self.need(ptr + nsect)
-                cylmap = self.octets[ptr:ptr + nsect]
                 ptr += nsect
-                # can we check cylmap ?
-
             if headmap:
-                self.need(ptr + nsect)
-                headmap = self.octets[ptr:ptr + nsect]
                 ptr += nsect
-                # can we check headmap ?
 
+            # The length of the track record depends on the sector
+            # states, so we walk those, and only check bounds once
+            # the entire track record has been found.
             seclen = 128 << sectsize
-            for _secno in range(1, nsect + 1):
+            state = 0
+            offsets = []
+            try:
+                for _secno in range(nsect):
+                    state = octets[ptr]
+                    if state > 8:
+                        break
+                    offsets.append(ptr)
+                    if not state:
+                        ptr += 1
+                    elif state & 1:
+                        ptr += 1 + seclen
+                    else:
+                        ptr += 2
+            except IndexError:
                 self.need(ptr + 1)
-                state = self.octets[ptr]
-                ptr += 1
-                if state in (1, 3, 5, 7):
-                    self.need(ptr + seclen)
-                    ptr += seclen
-                elif state in (2, 4, 6, 8):
-                    self.need(ptr + 1)
-                    ptr += 1
-                elif state:
-                    yield FileFormatError("Illegal sector state (0x%x)" % state)
-                    return
+            if state > 8:
+                yield FileFormatError("Illegal sector state (0x%x)" % state)
+                return
+            self.need(ptr)
+
+            index.track_offset.append(track_offset)
+            index.track_first.append(len(index.sector_offset))
+            index.track_cyl.append(cyl)
+            index.track_head.append(head)
+            index.track_nsect.append(nsect)
+            index.track_sectsize.append(sectsize)
+            index.sector_num.frombytes(sec_num_map)
+            index.sector_state.frombytes(bytes(map(octets.__getitem__, offsets)))
+            index.sector_offset.fromlist(offsets)
+
+    def raw_image(self, cache_dir=RAW_CACHE_DIR):
+        '''
+           Filename of the decoded raw image, cached by digest
+
+           The image is decoded (and the artifact validated) only if
+           it is not already in the cache.
+        '''
+        digest = self.mdi.BitStore.Digest.val
+        if digest is None:
+            digest = "sha256:" + hashlib.sha256(self.octets).hexdigest()
+        filename = os.path.join(cache_dir, digest[7:] + ".raw")
+        if os.path.exists(filename):
+            return filename
+        if self.index is None:
+            for err in self.litany():
+                raise err
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(filename + ".tmp", "wb") as file:
+            self.index.decode(self.octets, file)
+        os.replace(filename + ".tmp", filename)
+        return filename
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2012-2021 Poul-Henning Kamp <phk@phk.freebsd.dk>
+# All rights reserved.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+'''
+    ISO9660 Format
+    ==============
+
+    Only the volume descriptor set and the path tables are read, the
+    directories are only parsed if the directory tree is used.
+'''
+
+import struct
+
+from ..internals.fileformatclass import FileFormat, FileFormatError
+
+SECTOR = 2048
+FIRST_DESCRIPTOR = 16
+MAX_DESCRIPTORS = 64
+
+PRIMARY = 1
+SUPPLEMENTARY = 2
+TERMINATOR = 255
+
+JOLIET_ESCAPES = (b'%/@', b'%/C', b'%/E')
+
+PATH_ENTRY = struct.Struct("<BBLH")
+PATH_ENTRY_BE = struct.Struct(">BBLH")
+DIR_RECORD = struct.Struct("<BBL4xL4x7xB6xB")
+
+class VolumeDescriptor():
+    ''' Primary or Joliet volume descriptor '''
+
+    def __init__(self, octets, offset):
+        self.offset = offset
+        self.type = octets[offset]
+        self.joliet = octets[offset + 88:offset + 91] in JOLIET_ESCAPES
+        self.complaints = []
+        self.volume_id = self.text(octets[offset + 40:offset + 72])
+        self.space_size = self.both(octets, 80, "<L", ">L")
+        self.block_size = self.both(octets, 128, "<H", ">H")
+        self.path_table_size = self.both(octets, 132, "<L", ">L")
+        self.l_path_table = struct.unpack_from("<L", octets, offset + 140)[0]
+        self.m_path_table = struct.unpack_from(">L", octets, offset + 148)[0]
+        self.root = DIR_RECORD.unpack_from(octets, offset + 156)
+
+    def __repr__(self):
+        return "<VolumeDescriptor %d %s>" % (self.type, self.volume_id)
+
+    def text(self, octets):
+        ''' Decode identifier '''
+        if self.joliet:
+            return octets.tobytes().decode("utf_16_be", "replace").rstrip()
+        return octets.tobytes().decode("ascii", "replace").rstrip()
+
+    def both(self, octets, where, lfmt, bfmt):
+        ''' Both-endian field, complain if the two do not agree '''
+        lval = struct.unpack_from(lfmt, octets, self.offset + where)[0]
+        bval = struct.unpack_from(bfmt, octets, self.offset + where + struct.calcsize(lfmt))[0]
+        if lval != bval:
+            self.complaints.append(
+                FileFormatError(
+                    "ISO9660: Both-endian field at 0x%x disagrees (0x%x != 0x%x)" % (
+                        self.offset + where, lval, bval
+                    )
+                )
+            )
+        return lval
+
+def parse_path_table(octets, start, size, entry):
+    ''' Return list of (extent, parent, name) '''
+    table = []
+    ptr = start
+    end = start + size
+    while ptr < end:
+        len_di, _ext_len, extent, parent = entry.unpack_from(octets, ptr)
+        if not len_di:
+            break
+        ptr += entry.size
+        table.append((extent, parent, octets[ptr:ptr + len_di].tobytes()))
+        ptr += len_di + (len_di & 1)
+    return table
+
+class IsoTree():
+    '''
+       Lazy directory tree
+
+       The directory paths come from the path table, the contents of
+       a directory is only parsed when asked for.
+    '''
+
+    def __init__(self, octets, descriptor, path_table):
+        self.octets = octets
+        self.descriptor = descriptor
+        self.block_size = descriptor.block_size
+        self.paths = {}
+        names = []
+        for extent, parent, name in path_table:
+            if not names:
+                path = "/"
+            else:
+                path = names[parent - 1].rstrip("/") + "/" + self.name(name)
+            names.append(path)
+            self.paths[path] = extent
+
+    def __iter__(self):
+        yield from self.paths
+
+    def __len__(self):
+        return len(self.paths)
+
+    def name(self, octets):
+        ''' Decode a file identifier '''
+        if self.descriptor.joliet:
+            name = octets.decode("utf_16_be", "replace")
+        else:
+            name = octets.decode("ascii", "replace")
+        return name.split(";")[0]
+
+    def listdir(self, path):
+        ''' Yield (name, extent, size, is_directory) for a directory '''
+        ptr = self.paths[path] * self.block_size
+        # The "." entry has the size of the directory
+        size = DIR_RECORD.unpack_from(self.octets, ptr)[3]
+        end = ptr + size
+        while ptr < end:
+            reclen = self.octets[ptr]
+            if not reclen:
+                # Records do not span blocks, skip to next
+                ptr = (ptr // self.block_size + 1) * self.block_size
+                continue
+            _reclen, _ext_len, extent, length, flags, len_fi = DIR_RECORD.unpack_from(
+                self.octets, ptr
+            )
+            name = self.octets[ptr + 33:ptr + 33 + len_fi]
+            ptr += reclen
+            if name in (b'\x00', b'\x01'):
+                continue
+            yield self.name(bytes(name)), extent, length, bool(flags & 2)
+
+class Iso(FileFormat):
+    ''' ... '''
+
+    EXTENSION = "iso"
+    ACCESS = "random"
+
+    @classmethod
+    def probe(cls, head, tail, length):
+        ptr = FIRST_DESCRIPTOR * SECTOR
+        return 100 if head[ptr + 1:ptr + 6] == b'CD001' else 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.index = None
+
+    def validate(self, **kwargs):
+        yield from super().validate(**kwargs)
+        self.need((FIRST_DESCRIPTOR + 1) * SECTOR)
+
+        octets = memoryview(self.octets)
+        primary = None
+        joliet = None
+        for sector in range(FIRST_DESCRIPTOR, FIRST_DESCRIPTOR + MAX_DESCRIPTORS):
+            ptr = sector * SECTOR
+            self.need(ptr + SECTOR)
+            if octets[ptr + 1:ptr + 6] != b'CD001' or octets[ptr + 6] != 1:
+                yield FileFormatError("ISO9660: Bad volume descriptor in sector %d" % sector)
+                return
+            vtype = octets[ptr]
+            if vtype == TERMINATOR:
+                break
+            if vtype == PRIMARY and primary is None:
+                primary = VolumeDescriptor(octets, ptr)
+            elif vtype == SUPPLEMENTARY and joliet is None:
+                descriptor = VolumeDescriptor(octets, ptr)
+                if descriptor.joliet:
+                    joliet = descriptor
+        else:
+            yield FileFormatError("ISO9660: Volume descriptor set not terminated")
+            return
+
+        if primary is None:
+            yield FileFormatError("ISO9660: No primary volume descriptor")
+            return
+
+        volume_size = primary.space_size * primary.block_size
+        bitstore_size = self.mdi.BitStore.Size.val
+        if volume_size > len(octets):
+            yield FileFormatError(
+                "ISO9660: Volume size (%d) larger than artifact (%d)" % (volume_size, len(octets))
+            )
+        elif bitstore_size and bitstore_size.isdigit() and int(bitstore_size) != volume_size:
+            yield FileFormatError(
+                "ISO9660: Volume size (%d) disagrees with BitStore.Size (%s)" % (
+                    volume_size, bitstore_size
+                )
+            )
+
+        tree = None
+        for descriptor in (primary, joliet):
+            if descriptor is None:
+                continue
+            yield from descriptor.complaints
+            if descriptor.block_size not in (512, 1024, 2048):
+                yield FileFormatError(
+                    "ISO9660: Bad logical block size (%d)" % descriptor.block_size
+                )
+                return
+            bsz = descriptor.block_size
+            tables = []
+            for where, entry in (
+                (descriptor.l_path_table, PATH_ENTRY),
+                (descriptor.m_path_table, PATH_ENTRY_BE),
+            ):
+                start = where * bsz
+                if where >= descriptor.space_size or start + descriptor.path_table_size > len(octets):
+                    yield FileFormatError("ISO9660: Path table outside volume")
+                    return
+                tables.append(parse_path_table(octets, start, descriptor.path_table_size, entry))
+            if not tables[0]:
+                yield FileFormatError("ISO9660: Empty path table")
+                return
+            if tables[0] != tables[1]:
+                yield FileFormatError("ISO9660: L and M path tables differ")
+                return
+            for num, (extent, parent, _name) in enumerate(tables[0], start=1):
+                if not 1 <= parent <= num or extent >= descriptor.space_size:
+                    yield FileFormatError("ISO9660: Bad path table entry %d" % num)
+                    return
+            tree = IsoTree(self.octets, descriptor, tables[0])
+
+        self.index = tree
+        self.mdi.artifact.index = tree
+        self.mdi.artifact.statistics["iso9660"] = {
+            "volume_id": (joliet or primary).volume_id,
+            "blocks": primary.space_size,
+            "directories": len(tree),
+            "joliet": joliet is not None,
+        }
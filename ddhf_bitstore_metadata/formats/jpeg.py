@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2012-2021 Poul-Henning Kamp <phk@phk.freebsd.dk>
+# All rights reserved.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+'''
+    JPEG Format
+    ===========
+
+    The markers and segment lengths are walked from SOI to EOI, the
+    entropy coded data is skipped with a regular expression, nothing
+    is decoded.
+'''
+
+import re
+import struct
+
+from ..internals.fileformatclass import FileFormat, FileFormatError
+
+SOI = 0xd8
+EOI = 0xd9
+SOS = 0xda
+TEM = 0x01
+RST = range(0xd0, 0xd8)
+SOF = set(range(0xc0, 0xd0)) - {0xc4, 0xc8, 0xcc}
+
+SEGMENT = struct.Struct(">BBH")
+FRAME = struct.Struct(">BHHB")
+
+# Next marker after entropy coded data (not stuffing, not restart, not fill)
+NEXT_MARKER = re.compile(rb'\xff[\x01-\xcf\xd8-\xfe]')
+
+# Files are often padded with NULs after the EOI marker
+NOT_PADDING = re.compile(rb'[^\x00]')
+
+class JPG(FileFormat):
+    ''' ... '''
+
+    EXTENSION = "jpg"
+    ACCESS = "sequential"
+
+    @classmethod
+    def probe(cls, head, tail, length):
+        if head[:3] != b'\xff\xd8\xff':
+            return 0
+        return 100 if tail.rstrip(b'\x00')[-2:] == b'\xff\xd9' else 80
+
+    def validate(self, **kwargs):
+        yield from super().validate(**kwargs)
+        self.need(4)
+
+        if self.octets[:3] != b'\xff\xd8\xff':
+            yield FileFormatError("JPEG: No SOI marker")
+            return
+
+        frame = None
+        scans = 0
+        segments = 0
+        ptr = 2
+        length = len(self.octets)
+        while True:
+            self.need(ptr + 2)
+            if self.octets[ptr] != 0xff:
+                yield FileFormatError("JPEG: Expected marker at 0x%x" % ptr)
+                return
+            marker = self.octets[ptr + 1]
+            if marker == 0xff:
+                # Fill byte
+                ptr += 1
+                continue
+            if marker == EOI:
+                ptr += 2
+                break
+            if marker == SOI or marker in RST:
+                yield FileFormatError("JPEG: Unexpected marker 0x%02x at 0x%x" % (marker, ptr))
+                return
+            if marker == TEM:
+                ptr += 2
+                continue
+            self.need(ptr + SEGMENT.size)
+            _ff, _marker, slen = SEGMENT.unpack_from(self.octets, ptr)
+            if slen < 2:
+                yield FileFormatError("JPEG: Bad segment length at 0x%x" % ptr)
+                return
+            self.need(ptr + 2 + slen)
+            segments += 1
+            if marker in SOF:
+                frame = FRAME.unpack_from(self.octets, ptr + 4)
+            ptr += 2 + slen
+            if marker == SOS:
+                if frame is None:
+                    yield FileFormatError("JPEG: Scan before frame header")
+                    return
+                scans += 1
+                match = NEXT_MARKER.search(self.octets, ptr)
+                if not match:
+                    yield FileFormatError("JPEG: Entropy coded data runs off end (truncated ?)")
+                    return
+                ptr = match.start()
+
+        if not scans:
+            yield FileFormatError("JPEG: No scans")
+        match = NOT_PADDING.search(self.octets, ptr)
+        if match:
+            yield FileFormatError(
+                "JPEG: Trailing data at 0x%x, %d bytes after EOI" % (match.start(), length - ptr)
+            )
+
+        if frame:
+            depth, height, width, components = frame
+            self.mdi.artifact.statistics["jpeg"] = {
+                "width": width,
+                "height": height,
+                "precision": depth,
+                "components": components,
+                "scans": scans,
+                "segments": segments,
+            }
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2012-2021 Poul-Henning Kamp <phk@phk.freebsd.dk>
+# All rights reserved.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+'''
+    KryoFlux Format
+    ===============
+
+    A Zip archive of KryoFlux raw stream files, one per track and
+    side, named trackCC.H.raw.
+
+    The members are decompressed in memory one at a time and the
+    streams parsed for their OOB blocks.  Single octet flux cells,
+    by far the most common, are never looked at one by one: only the
+    other cells, found with a regex search, are decoded in Python.
+    The flux statistics are computed with numpy if available.
+'''
+
+import re
+import struct
+import zipfile
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from ..internals.fileformatclass import FileFormat, FileFormatError
+
+# Sample and index clocks
+SCK = 18432000 * 73 / 14 / 4
+ICK = SCK / 8
+
+TRACK_NAME = re.compile(r'(?:^|/)track(\d\d)\.(\d)\.raw$')
+TRACK_NAME_OCTETS = re.compile(rb'track\d\d\.\d\.raw')
+
+OOB = 0x0d
+OOB_HEADER = struct.Struct("<BH")
+STREAM_INFO = 0x01
+INDEX = 0x02
+STREAM_END = 0x03
+KF_INFO = 0x04
+OOB_EOF = 0x0d
+
+POSITION = struct.Struct("<L")
+INDEX_BLOCK = struct.Struct("<LLL")
+STREAM_END_BLOCK = struct.Struct("<LL")
+
+OVL16 = 0x0b
+NOT_FLUX1 = re.compile(rb'[\x00-\x0d]')
+# The opcode counts in the length: Nop1, Nop2 and Nop3 are 1, 2 and 3 octets
+CELL = re.compile(rb'\x0b*(?:[\x00-\x07].|\x0c..|[\x0e-\xff])|\x08|\x09.|\x0a..', re.DOTALL)
+
+class StreamError(Exception):
+    ''' Problem with a stream '''
+
+class Stream():
+    ''' One parsed KryoFlux stream '''
+
+    def __init__(self, data):
+        self.flux1 = []
+        self.fluxes = []
+        self.index = []
+        self.result = None
+        self.kf_info = []
+        self.parse(data)
+        self.flux1 = b''.join(self.flux1)
+
+    def parse(self, data):
+        ''' Walk the cells and OOB blocks '''
+        length = len(data)
+        pos = 0
+        ptr = 0
+        while True:
+            match = NOT_FLUX1.search(data, ptr)
+            if not match:
+                raise StreamError("No EOF block (truncated ?)")
+            start = match.start()
+            self.flux1.append(data[ptr:start])
+            pos += start - ptr
+            if data[start] != OOB:
+                cell = CELL.match(data, start)
+                if not cell:
+                    raise StreamError("Truncated flux cell at 0x%x" % start)
+                self.decode_cell(cell.group())
+                pos += cell.end() - start
+                ptr = cell.end()
+                continue
+            if start + 1 + OOB_HEADER.size > length:
+                raise StreamError("Truncated OOB block at 0x%x" % start)
+            otype, osize = OOB_HEADER.unpack_from(data, start + 1)
+            if otype == OOB_EOF:
+                return
+            body = data[start + 1 + OOB_HEADER.size:start + 1 + OOB_HEADER.size + osize]
+            if len(body) < osize:
+                raise StreamError("Truncated OOB block at 0x%x" % start)
+            if otype in (STREAM_INFO, STREAM_END):
+                spos = POSITION.unpack_from(body)[0]
+                if spos != pos:
+                    raise StreamError(
+                        "Stream position %d in OOB block at 0x%x, expected %d" % (spos, start, pos)
+                    )
+            if otype == INDEX:
+                self.index.append(INDEX_BLOCK.unpack_from(body))
+            elif otype == STREAM_END:
+                self.result = STREAM_END_BLOCK.unpack_from(body)[1]
+            elif otype == KF_INFO:
+                self.kf_info.append(body.rstrip(b'\x00').decode("ascii", "replace"))
+            elif otype != STREAM_INFO:
+                raise StreamError("Bad OOB block type 0x%02x at 0x%x" % (otype, start))
+            ptr = start + 1 + OOB_HEADER.size + osize
+
+    def decode_cell(self, cell):
+        ''' Decode a cell which is not a single octet flux '''
+        ovl = 0
+        while cell[ovl] == OVL16:
+            ovl += 1
+        code = cell[ovl]
+        if code <= 0x07:
+            value = (code << 8) | cell[ovl + 1]
+        elif code == 0x0c:
+            value = (cell[ovl + 1] << 8) | cell[ovl + 2]
+        elif code >= 0x0e:
+            value = code
+        else:
+            # Nop1, Nop2, Nop3
+            return
+        self.fluxes.append(value + (ovl << 16))
+
+    def statistics(self):
+        ''' Flux statistics '''
+        count = len(self.flux1) + len(self.fluxes)
+        stats = {
+            "fluxes": count,
+            "revolutions": max(0, len(self.index) - 1),
+        }
+        if count:
+            if numpy is not None:
+                fluxes = numpy.concatenate((
+                    numpy.frombuffer(self.flux1, numpy.uint8),
+                    numpy.array(self.fluxes, numpy.int64),
+                ))
+                ticks, shortest, longest = int(fluxes.sum()), int(fluxes.min()), int(fluxes.max())
+                stats["stddev_us"] = round(float(fluxes.std()) / SCK * 1e6, 3)
+            else:
+                ticks = sum(self.flux1) + sum(self.fluxes)
+                shortest = min(min(self.flux1, default=0xff), min(self.fluxes, default=0xff))
+                longest = max(max(self.flux1, default=0), max(self.fluxes, default=0))
+            stats["mean_us"] = round(ticks / count / SCK * 1e6, 3)
+            stats["min_us"] = round(shortest / SCK * 1e6, 3)
+            stats["max_us"] = round(longest / SCK * 1e6, 3)
+        if len(self.index) > 1:
+            period = (self.index[-1][2] - self.index[0][2]) / (len(self.index) - 1) / ICK
+            if period:
+                stats["rpm"] = round(60 / period, 2)
+        return stats
+
+class KryoFlux(FileFormat):
+    ''' ... '''
+
+    EXTENSION = "zip"
+
+    @classmethod
+    def probe(cls, head, tail, length):
+        if head[:4] != b'PK\x03\x04':
+            return 0
+        if TRACK_NAME_OCTETS.search(head) or TRACK_NAME_OCTETS.search(tail):
+            return 90
+        return 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tracks = {}
+
+    def validate(self, max_errors=20, **kwargs):
+        yield from super().validate(**kwargs)
+        try:
+            self.mdi.artifact.open_bagit()
+        except Exception as err:
+            yield FileFormatError(str(err))
+            return
+
+        errors = []
+        bad = set()
+        for entry in self.mdi.artifact.zipdir.entries():
+            match = TRACK_NAME.search(entry.filename)
+            if not match:
+                continue
+            track = (int(match.group(1)), int(match.group(2)))
+            if track in self.tracks or track in bad:
+                errors.append("Duplicate track %s" % entry.filename)
+                continue
+            try:
+                with self.mdi.artifact.open_member(entry) as file:
+                    stream = Stream(file.read())
+            except (zipfile.BadZipFile, zlib.error, StreamError) as err:
+                errors.append("%s: %s" % (entry.filename, str(err)))
+                bad.add(track)
+                continue
+            # Only the statistics are kept, not the fluxes of every track
+            self.tracks[track] = stream.statistics()
+            if stream.result is None:
+                errors.append("%s: No StreamEnd block" % entry.filename)
+            elif stream.result:
+                errors.append("%s: StreamEnd reports error %d" % (entry.filename, stream.result))
+            elif len(stream.index) < 2:
+                errors.append("%s: No complete revolution" % entry.filename)
+
+        if not self.tracks:
+            yield FileFormatError("KryoFlux: No track streams")
+            return
+
+        cylinders = sorted(set(cyl for cyl, _head in self.tracks))
+        heads = sorted(set(head for _cyl, head in self.tracks))
+        # 40 track media are read with double steps
+        step = 2 if len(cylinders) > 1 and all(cyl % 2 == 0 for cyl in cylinders) else 1
+        for cyl in range(cylinders[0], cylinders[-1] + 1, step):
+            for head in heads:
+                if (cyl, head) not in self.tracks and (cyl, head) not in bad:
+                    errors.append("Missing track%02d.%d.raw" % (cyl, head))
+
+        for err in errors[:max_errors]:
+            yield FileFormatError("KryoFlux: " + err)
+        if len(errors) > max_errors:
+            yield FileFormatError("KryoFlux: … and %d more errors" % (len(errors) - max_errors))
+
+        statistics = self.mdi.artifact.statistics
+        rpms = []
+        for (cyl, head), stats in sorted(self.tracks.items()):
+            statistics["kryoflux track%02d.%d" % (cyl, head)] = stats
+            if "rpm" in stats:
+                rpms.append(stats["rpm"])
+        statistics["kryoflux"] = {
+            "tracks": len(self.tracks),
+            "cylinders": "%d-%d" % (cylinders[0], cylinders[-1]),
+            "heads": len(heads),
+            "step": step,
+            "rpm": round(sum(rpms) / len(rpms), 2) if rpms else None,
+        }
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2012-2021 Poul-Henning Kamp <phk@phk.freebsd.dk>
+# All rights reserved.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+'''
+    MP4 Format
+    ==========
+
+    The top-level boxes and the boxes in moov are walked by offset,
+    the media data is never read.
+'''
+
+import struct
+
+from ..internals.fileformatclass import FileFormat, FileFormatError
+
+BOX = struct.Struct(">L4s")
+LARGESIZE = struct.Struct(">Q")
+MVHD_V0 = struct.Struct(">4x4x4xLL")
+MVHD_V1 = struct.Struct(">4x8x8xLQ")
+
+class MP4(FileFormat):
+    ''' ... '''
+
+    EXTENSION = "mp4"
+    ACCESS = "random"
+
+    @classmethod
+    def probe(cls, head, tail, length):
+        return 100 if head[4:8] == b'ftyp' else 0
+
+    def walk_boxes(self, octets, ptr, end):
+        ''' Yield (type, payload start, box end), raise FileFormatError on trouble '''
+        while ptr < end:
+            if ptr + BOX.size > end:
+                raise FileFormatError("MP4: %d stray bytes at 0x%x" % (end - ptr, ptr))
+            size, btype = BOX.unpack_from(octets, ptr)
+            payload = ptr + BOX.size
+            if size == 1:
+                self.need(payload + LARGESIZE.size)
+                size = LARGESIZE.unpack_from(octets, payload)[0]
+                payload += LARGESIZE.size
+            elif size == 0:
+                # Box extends to the end
+                size = end - ptr
+            if size < payload - ptr:
+                raise FileFormatError("MP4: Bad size of '%s' box at 0x%x" % (btype.decode("latin1"), ptr))
+            if ptr + size > end:
+                raise FileFormatError(
+                    "MP4: '%s' box at 0x%x extends %d bytes beyond its container" % (
+                        btype.decode("latin1"), ptr, ptr + size - end
+                    )
+                )
+            yield btype, payload, ptr + size
+            ptr += size
+
+    def validate(self, **kwargs):
+        yield from super().validate(**kwargs)
+        self.need(BOX.size)
+
+        octets = self.octets
+        boxes = {}
+        moov = None
+        try:
+            for btype, payload, end in self.walk_boxes(octets, 0, len(octets)):
+                if not boxes and btype != b'ftyp':
+                    yield FileFormatError("MP4: First box is not 'ftyp'")
+                    return
+                boxes.setdefault(btype, []).append((payload, end))
+                if btype == b'moov' and moov is None:
+                    moov = list(self.walk_boxes(octets, payload, end))
+        except FileFormatError as err:
+            yield err
+            return
+
+        for btype in (b'ftyp', b'moov', b'mdat'):
+            if btype not in boxes:
+                yield FileFormatError("MP4: No '%s' box" % btype.decode("ascii"))
+        if moov is None:
+            return
+
+        mvhd = [(payload, end) for btype, payload, end in moov if btype == b'mvhd']
+        if not mvhd:
+            yield FileFormatError("MP4: No 'mvhd' box in 'moov'")
+            return
+        payload, end = mvhd[0]
+        layout = MVHD_V1 if octets[payload] == 1 else MVHD_V0
+        if payload + layout.size > end:
+            yield FileFormatError("MP4: 'mvhd' box too short")
+            return
+        timescale, duration = layout.unpack_from(octets, payload)
+
+        ftyp = boxes[b'ftyp'][0][0]
+        self.mdi.artifact.statistics["mp4"] = {
+            "brand": octets[ftyp:ftyp + 4].decode("latin1"),
+            "boxes": sum(len(x) for x in boxes.values()),
+            "tracks": sum(1 for btype, _payload, _end in moov if btype == b'trak'),
+            "seconds": round(duration / timescale, 3) if timescale else None,
+            "mdat_octets": sum(end - payload for payload, end in boxes.get(b'mdat', [])),
+        }
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2012-2021 Poul-Henning Kamp <phk@phk.freebsd.dk>
+# All rights reserved.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+'''
+    PDF Format
+    ==========
+
+    Structural checks only: The header, the trailer at the end of the
+    file, the cross-reference table or stream it points to, and that a
+    sample of the object offsets in it lead to the objects.
+'''
+
+import re
+import zlib
+
+from ..internals.fileformatclass import FileFormat, FileFormatError
+
+TAIL = 1024
+WINDOW = 4096
+SAMPLE = 16
+
+HEADER = re.compile(rb'%PDF-(\d\.\d)')
+STARTXREF = re.compile(rb'startxref\s+(\d+)\s+%%EOF')
+SUBSECTION = re.compile(rb'\s*(\d+)\s+(\d+)[ \t]*\r?\n')
+OBJECT = re.compile(rb'\s*(\d+)\s+(\d+)\s+obj\b')
+STREAM = re.compile(rb'>>\s*stream\r?\n')
+ENTRY = re.compile(rb'(\d{10}) (\d{5}) ([nf])')
+SIZE = re.compile(rb'/Size\s+(\d+)')
+ENDSTREAM = re.compile(rb'endstream')
+LENGTH = re.compile(rb'/Length\s+(\d+)(\s+\d+\s+R)?')
+ARRAY = rb'\s*\[([\d\s]*)\]'
+
+class PdfError(Exception):
+    ''' Structural problem '''
+
+def xref_table(octets, ptr):
+    '''
+       Classic cross-reference table at ptr.
+
+       Returns the subsections as (first object, count, offset, entry length)
+       and the trailer dictionary.
+    '''
+    ptr += 4
+    subsections = []
+    while True:
+        window = bytes(octets[ptr:ptr + 64])
+        match = SUBSECTION.match(window)
+        if not match:
+            break
+        first, count = int(match.group(1)), int(match.group(2))
+        ptr += match.end()
+        # Entries should be 20 bytes, but a single character EOL is seen
+        entry = bytes(octets[ptr:ptr + 20])
+        if len(entry) < 19 or not ENTRY.match(entry):
+            raise PdfError("Bad cross-reference entry at 0x%x" % ptr)
+        width = 20 if entry[18:20] in (b' \n', b' \r', b'\r\n') else 19
+        subsections.append((first, count, ptr, width))
+        ptr += count * width
+    window = bytes(octets[ptr:ptr + WINDOW])
+    match = re.match(rb'\s*trailer\s*<<', window)
+    if not match:
+        raise PdfError("No trailer after cross-reference table at 0x%x" % ptr)
+    return subsections, window[match.end():]
+
+def sample_table(octets, subsections, sample):
+    ''' Yield (object number, offset) for a sample of in-use entries '''
+    total = sum(count for _first, count, _ptr, _width in subsections)
+    if not total:
+        return
+    picks = sorted(set(total * i // sample for i in range(sample)))
+    base = 0
+    for first, count, ptr, width in subsections:
+        while picks and picks[0] < base + count:
+            idx = picks.pop(0) - base
+            eptr = ptr + idx * width
+            entry = ENTRY.match(bytes(octets[eptr:eptr + 18]))
+            if not entry:
+                raise PdfError("Bad cross-reference entry at 0x%x" % eptr)
+            if entry.group(3) == b'n':
+                yield first + idx, int(entry.group(1))
+        base += count
+
+def png_predictor(data, columns, predictor):
+    ''' Undo PNG predictors on rows of columns bytes '''
+    if predictor < 10:
+        return data
+    out = bytearray()
+    prev = bytearray(columns)
+    for ptr in range(0, len(data) - columns, columns + 1):
+        kind = data[ptr]
+        row = bytearray(data[ptr + 1:ptr + 1 + columns])
+        for col in range(columns):
+            left = row[col - 1] if col else 0
+            if kind == 1:
+                row[col] = (row[col] + left) & 0xff
+            elif kind == 2:
+                row[col] = (row[col] + prev[col]) & 0xff
+            elif kind == 3:
+                row[col] = (row[col] + (left + prev[col]) // 2) & 0xff
+            elif kind == 4:
+                upleft = prev[col - 1] if col else 0
+                est = left + prev[col] - upleft
+                dist = [abs(est - left), abs(est - prev[col]), abs(est - upleft)]
+                row[col] = (row[col] + (left, prev[col], upleft)[dist.index(min(dist))]) & 0xff
+        out += row
+        prev = row
+    return bytes(out)
+
+def xref_stream(octets, ptr, window):
+    ''' Cross-reference stream object, returns (dictionary, [(type, field2)]) '''
+    match = STREAM.search(window)
+    if not match:
+        raise PdfError("No cross-reference stream at 0x%x" % ptr)
+    dictionary = window[:match.start()]
+    start = ptr + match.end()
+    length = LENGTH.search(dictionary)
+    if length and not length.group(2):
+        end = start + int(length.group(1))
+    else:
+        end = ENDSTREAM.search(octets, start)
+        end = end.start() if end else -1
+    if end < 0 or end > len(octets):
+        raise PdfError("Cross-reference stream at 0x%x truncated" % ptr)
+    data = octets[start:end]
+    if b'/FlateDecode' in dictionary:
+        try:
+            data = zlib.decompressobj().decompress(data)
+        except zlib.error as err:
+            raise PdfError("Cross-reference stream at 0x%x: %s" % (ptr, str(err))) from err
+    elif b'/Filter' in dictionary:
+        raise PdfError("Cross-reference stream at 0x%x has unsupported filter" % ptr)
+
+    wfield = re.search(rb'/W' + ARRAY, dictionary)
+    size = SIZE.search(dictionary)
+    if not wfield or not size:
+        raise PdfError("Cross-reference stream at 0x%x lacks /W or /Size" % ptr)
+    widths = [int(x) for x in wfield.group(1).split()]
+    if len(widths) != 3:
+        raise PdfError("Cross-reference stream at 0x%x has bad /W" % ptr)
+    index = re.search(rb'/Index' + ARRAY, dictionary)
+    if index:
+        index = [int(x) for x in index.group(1).split()]
+    else:
+        index = [0, int(size.group(1))]
+
+    predictor = re.search(rb'/Predictor\s+(\d+)', dictionary)
+    if predictor:
+        columns = re.search(rb'/Columns\s+(\d+)', dictionary)
+        columns = int(columns.group(1)) if columns else 1
+        data = png_predictor(data, columns, int(predictor.group(1)))
+
+    entries = []
+    step = sum(widths)
+    ptr = 0
+    for first, count in zip(index[0::2], index[1::2]):
+        for num in range(first, first + count):
+            row = data[ptr:ptr + step]
+            if len(row) < step:
+                raise PdfError("Cross-reference stream shorter than /Index")
+            kind = int.from_bytes(row[:widths[0]], "big") if widths[0] else 1
+            field2 = int.from_bytes(row[widths[0]:widths[0] + widths[1]], "big")
+            entries.append((num, kind, field2))
+            ptr += step
+    return dictionary, entries
+
+class PDF(FileFormat):
+    ''' ... '''
+
+    EXTENSION = "pdf"
+    ACCESS = "random"
+
+    @classmethod
+    def probe(cls, head, tail, length):
+        if head[:5] != b'%PDF-':
+            return 0
+        return 100 if b'%%EOF' in tail else 80
+
+    def validate(self, pdf_sample=SAMPLE, **kwargs):
+        yield from super().validate(**kwargs)
+        self.need(16)
+
+        header = HEADER.match(self.octets[:16])
+        if not header:
+            yield FileFormatError("PDF: No %PDF- header")
+            return
+
+        length = len(self.octets)
+        tail = bytes(self.octets[max(0, length - TAIL):])
+        if b'%%EOF' not in tail:
+            yield FileFormatError("PDF: No %%EOF at end of file (truncated ?)")
+            return
+        startxref = None
+        for startxref in STARTXREF.finditer(tail):
+            pass
+        if not startxref:
+            yield FileFormatError("PDF: No startxref in trailer")
+            return
+        ptr = int(startxref.group(1))
+        if ptr >= length:
+            yield FileFormatError("PDF: startxref (%d) beyond end of file" % ptr)
+            return
+
+        try:
+            window = bytes(self.octets[ptr:ptr + WINDOW])
+            if window[:4] == b'xref':
+                kind = "table"
+                subsections, trailer = xref_table(self.octets, ptr)
+                samples = list(sample_table(self.octets, subsections, pdf_sample))
+                size = SIZE.search(trailer)
+            else:
+                kind = "stream"
+                if not OBJECT.match(window):
+                    raise PdfError("startxref (%d) does not point to cross-reference" % ptr)
+                trailer, entries = xref_stream(self.octets, ptr, window)
+                used = [(num, field2) for num, typ, field2 in entries if typ == 1]
+                samples = [used[len(used) * i // pdf_sample] for i in range(pdf_sample) if used]
+                samples = sorted(set(samples))
+                size = SIZE.search(trailer)
+        except PdfError as err:
+            yield FileFormatError("PDF: " + str(err))
+            return
+
+        if b'/Root' not in trailer:
+            yield FileFormatError("PDF: Trailer has no /Root")
+        if not size:
+            yield FileFormatError("PDF: Trailer has no /Size")
+
+        bad = []
+        for num, offset in samples:
+            obj = OBJECT.match(self.octets[offset:offset + 64]) if offset < length else None
+            if not obj or int(obj.group(1)) != num:
+                bad.append(num)
+        if bad:
+            yield FileFormatError(
+                "PDF: %d of %d sampled objects not at their offset (first: object %d)" % (
+                    len(bad), len(samples), bad[0]
+                )
+            )
+
+        self.mdi.artifact.statistics["pdf"] = {
+            "version": header.group(1).decode("ascii"),
+            "xref": kind,
+            "objects": int(size.group(1)) if size else None,
+            "sampled": len(samples),
+        }
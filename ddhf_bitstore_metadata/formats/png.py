@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2012-2021 Poul-Henning Kamp <phk@phk.freebsd.dk>
+# All rights reserved.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+'''
+    PNG Format
+    ==========
+
+    The chunks are walked and their CRCs checked, the image data is
+    not decompressed.
+'''
+
+import struct
+import zlib
+
+from ..internals.fileformatclass import FileFormat, FileFormatError
+
+SIGNATURE = b'\x89PNG\r\n\x1a\n'
+CHUNK = struct.Struct(">L4s")
+IHDR = struct.Struct(">LLBBBBB")
+
+class PNG(FileFormat):
+    ''' ... '''
+
+    EXTENSION = "png"
+    ACCESS = "sequential"
+
+    @classmethod
+    def probe(cls, head, tail, length):
+        return 100 if head[:len(SIGNATURE)] == SIGNATURE else 0
+
+    def validate(self, max_errors=20, **kwargs):
+        yield from super().validate(**kwargs)
+        self.need(len(SIGNATURE) + CHUNK.size + IHDR.size + 4)
+
+        if self.octets[:len(SIGNATURE)] != SIGNATURE:
+            yield FileFormatError("PNG: Bad signature")
+            return
+
+        chunks = {}
+        bad_crc = []
+        ptr = len(SIGNATURE)
+        length = len(self.octets)
+        with memoryview(self.octets) as octets:
+            while ptr < length:
+                self.need(ptr + CHUNK.size)
+                clen, ctype = CHUNK.unpack_from(octets, ptr)
+                if clen > 0x7fffffff or not ctype.isalpha():
+                    yield FileFormatError("PNG: Bad chunk header at 0x%x" % ptr)
+                    return
+                end = ptr + CHUNK.size + clen
+                self.need(end + 4)
+                if not chunks and ctype != b'IHDR':
+                    yield FileFormatError("PNG: First chunk is not IHDR")
+                    return
+                crc = struct.unpack_from(">L", octets, end)[0]
+                if zlib.crc32(octets[ptr + 4:end]) != crc:
+                    bad_crc.append((ptr, ctype))
+                chunks[ctype] = chunks.get(ctype, 0) + 1
+                if ctype == b'IHDR':
+                    ihdr = IHDR.unpack_from(octets, ptr + CHUNK.size)
+                ptr = end + 4
+                if ctype == b'IEND':
+                    break
+
+        for cptr, ctype in bad_crc[:max_errors]:
+            yield FileFormatError(
+                "PNG: Bad CRC on %s chunk at 0x%x" % (ctype.decode("ascii"), cptr)
+            )
+        if len(bad_crc) > max_errors:
+            yield FileFormatError("PNG: … and %d more bad CRCs" % (len(bad_crc) - max_errors))
+        if b'IEND' not in chunks:
+            yield FileFormatError("PNG: No IEND chunk")
+        elif ptr != length:
+            yield FileFormatError("PNG: %d bytes after IEND" % (length - ptr))
+        if b'IDAT' not in chunks:
+            yield FileFormatError("PNG: No IDAT chunk")
+
+        width, height, depth, color, _comp, _filt, interlace = ihdr
+        self.mdi.artifact.statistics["png"] = {
+            "width": width,
+            "height": height,
+            "bit_depth": depth,
+            "color_type": color,
+            "interlaced": bool(interlace),
+            "chunks": sum(chunks.values()),
+        }
@@ -33,18 +33,64 @@
 '''
 
 from ..internals.fileformatclass import FileFormat, FileFormatError
+from ..internals.exceptions import ShortFile
+
+CARD = 160
+COLUMNS = 80
+
+# Cards per chunk, (even) octets are checked a chunk at a time
+CHUNK_CARDS = 8192
+
+# 1 for octets with any of the unused bits set
+UNUSED_BITS = bytes(1 if i & 0xf else 0 for i in range(256))
 
 class SimhCrd(FileFormat):
     ''' ... '''
 
     EXTENSION = "crd"
+    ACCESS = "sequential"
+
+    @classmethod
+    def probe(cls, head, tail, length):
+        if length % CARD or len(head) < CARD or any(head[::2].translate(UNUSED_BITS)):
+            return 0
+        return 50
 
-    def validate(self, **kwargs):
+    def validate(self, max_errors=20, **kwargs):
         yield from super().validate(**kwargs)
-        self.need(160)
-        if len(self.octets) % 160:
+
+        # Runs of bad columns, numbered consecutively through the deck
+        runs = []
+        length = 0
+        for chunk in self.mdi.artifact.chunks(CARD * CHUNK_CARDS):
+            flags = bytes(chunk[::2]).translate(UNUSED_BITS)
+            col = length // 2
+            length += len(chunk)
+            i = flags.find(1)
+            while i >= 0:
+                j = flags.find(0, i)
+                if j < 0:
+                    j = len(flags)
+                if runs and runs[-1][1] == col + i:
+                    runs[-1][1] = col + j
+                else:
+                    runs.append([col + i, col + j])
+                i = flags.find(1, j)
+
+        if length < CARD:
+            raise ShortFile("Artifact (at least) %d bytes too short" % (CARD - length))
+        if length % CARD:
             yield FileFormatError("Bad file length")
-        for r in range(0, len(self.octets), 160):
-            for c in range(0, 160, 2):
-                if self.octets[r + c] & 0xf:
-                    yield FileFormatError("Unused bits are not zero")
+
+        for first, last in runs[:max_errors]:
+            where = "card %d column %d" % (first // COLUMNS + 1, first % COLUMNS + 1)
+            last -= 1
+            if last > first:
+                where += " … card %d column %d" % (last // COLUMNS + 1, last % COLUMNS + 1)
+            yield FileFormatError("Unused bits are not zero (%s)" % where)
+        if len(runs) > max_errors:
+            yield FileFormatError(
+                "Unused bits are not zero (%d more ranges, %d columns in total)" % (
+                    len(runs) - max_errors, sum(j - i for i, j in runs)
+                )
+            )
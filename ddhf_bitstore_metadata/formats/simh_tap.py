@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2012-2021 Poul-Henning Kamp <phk@phk.freebsd.dk>
+# All rights reserved.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+'''
+    SIMH-TAP Format
+    ===============
+
+    A sequence of records, each a 32 bit little-endian marker with
+    class and length, the data padded to even length and the marker
+    again.  Between records there can be tape marks, erase gaps and
+    an end of medium marker.
+'''
+
+import struct
+
+from ..internals.fileformatclass import FileFormat, FileFormatError
+from ..internals.arrayindex import ArrayIndex
+
+MARKER = struct.Struct("<L")
+
+TAPE_MARK = 0x00000000
+END_OF_MEDIUM = 0xffffffff
+ERASE_GAP = 0xfffffffe
+HALF_GAP = 0xfffeffff
+
+GOOD_DATA = 0x0
+BAD_DATA = 0x8
+
+# Record class in the top four bits, length in the rest
+LENGTH_MASK = 0x0fffffff
+
+class TapeIndex(ArrayIndex):
+    '''
+       Compact index of the records on a SIMH tape
+
+       Tape files are separated by tape marks, file f consists of
+       records file_first[f] … file_first[f + 1] - 1.
+    '''
+
+    MAGIC = b'TAPX\x01\x00\x00\x00'
+
+    ARRAYS = (
+        ("record_offset", "Q"),
+        ("record_length", "I"),
+        ("record_class", "B"),
+        ("file_first", "I"),
+    )
+
+    def __len__(self):
+        return len(self.file_first)
+
+    def records(self, fileno):
+        ''' Range of record numbers in file fileno '''
+        first = self.file_first[fileno]
+        if fileno + 1 < len(self.file_first):
+            return range(first, self.file_first[fileno + 1])
+        return range(first, len(self.record_offset))
+
+    def record(self, octets, fileno, recno):
+        ''' The data of record recno in file fileno, without copying '''
+        idx = self.records(fileno)[recno]
+        start = self.record_offset[idx]
+        return memoryview(octets)[start:start + self.record_length[idx]]
+
+class SimhTap(FileFormat):
+    ''' ... '''
+
+    EXTENSION = "tap"
+    ACCESS = "sequential"
+
+    @classmethod
+    def probe(cls, head, tail, length):
+        ptr = 0
+        while head[ptr:ptr + MARKER.size] == bytes(MARKER.size):
+            ptr += MARKER.size
+        if ptr + MARKER.size > len(head):
+            return 0
+        marker = MARKER.unpack_from(head, ptr)[0]
+        if not marker or marker >> 28 not in (GOOD_DATA, BAD_DATA):
+            return 0
+        end = ptr + MARKER.size + ((marker & LENGTH_MASK) + 1) // 2 * 2
+        if head[end:end + MARKER.size] != head[ptr:ptr + MARKER.size]:
+            return 0
+        return 90
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.index = None
+
+    def validate(self, save_index=False, **kwargs):
+        yield from super().validate(**kwargs)
+        self.need(4)
+
+        index = TapeIndex()
+        with memoryview(self.octets) as octets:
+            for err in self.walk_records(octets, index):
+                yield err
+                return
+
+        # Tape marks at the end do not start files
+        while len(index) and index.file_first[-1] == len(index.record_offset):
+            index.file_first.pop()
+
+        self.index = index
+        self.mdi.artifact.index = index
+        self.mdi.artifact.statistics["simh_tap"] = {
+            "files": len(index),
+            "records": len(index.record_offset),
+            "bad_records": index.record_class.count(BAD_DATA),
+        }
+        if save_index:
+            self.mdi.artifact.save_index()
+
+    def walk_records(self, octets, index):
+        ''' Walk the markers and records '''
+        length = len(octets)
+        ptr = 0
+        index.file_first.append(0)
+        while ptr < length:
+            self.need(ptr + MARKER.size)
+            marker = MARKER.unpack_from(octets, ptr)[0]
+            if marker == TAPE_MARK:
+                ptr += MARKER.size
+                index.file_first.append(len(index.record_offset))
+                continue
+            if marker == END_OF_MEDIUM:
+                ptr += MARKER.size
+                if ptr != length:
+                    yield FileFormatError(
+                        "SIMH-TAP: %d octets after end of medium marker" % (length - ptr)
+                    )
+                return
+            if marker == ERASE_GAP:
+                ptr += MARKER.size
+                continue
+            if marker == HALF_GAP:
+                ptr += MARKER.size // 2
+                continue
+
+            rclass = marker >> 28
+            rlength = marker & LENGTH_MASK
+            if rclass not in (GOOD_DATA, BAD_DATA):
+                yield FileFormatError(
+                    "SIMH-TAP: Unsupported marker 0x%08x at 0x%x" % (marker, ptr)
+                )
+                return
+            end = ptr + MARKER.size + rlength + (rlength & 1)
+            self.need(end + MARKER.size)
+            trailer = MARKER.unpack_from(octets, end)[0]
+            if trailer != marker:
+                yield FileFormatError(
+                    "SIMH-TAP: Record at 0x%x has trailing marker 0x%08x != 0x%08x" % (
+                        ptr, trailer, marker
+                    )
+                )
+                return
+            index.record_offset.append(ptr + MARKER.size)
+            index.record_length.append(rlength)
+            index.record_class.append(rclass)
+            ptr = end + MARKER.size
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2012-2021 Poul-Henning Kamp <phk@phk.freebsd.dk>
+# All rights reserved.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+'''
+    TAR Format
+    ==========
+
+    The 512 byte headers are walked by offset, the member data is
+    skipped without being read.
+'''
+
+from ..internals.fileformatclass import FileFormat, FileFormatError
+from ..internals.arrayindex import ArrayIndex
+
+BLOCK = 512
+ZERO_BLOCK = bytes(BLOCK)
+ASCII = bytes(range(0x80))
+
+GNU_LONGNAME = ord('L')
+GNU_LONGLINK = ord('K')
+PAX_HEADER = ord('x')
+PAX_GLOBAL = ord('g')
+
+class MemberIndex(ArrayIndex):
+    '''
+       Compact index of the members of a tar archive
+
+       The names are kept UTF-8 encoded back to back in names,
+       member n's name ending at name_end[n].
+    '''
+
+    MAGIC = b'TARX\x01\x00\x00\x00'
+
+    ARRAYS = (
+        ("member_header", "Q"),
+        ("member_offset", "Q"),
+        ("member_size", "Q"),
+        ("member_type", "B"),
+        ("name_end", "Q"),
+        ("names", "B"),
+    )
+
+    def __init__(self):
+        super().__init__()
+        self.by_name = None
+
+    def __len__(self):
+        return len(self.member_offset)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self.name(idx), self.member_offset[idx], self.member_size[idx]
+
+    def add(self, header, offset, size, typeflag, name):
+        ''' Add a member '''
+        self.member_header.append(header)
+        self.member_offset.append(offset)
+        self.member_size.append(size)
+        self.member_type.append(typeflag)
+        self.names.frombytes(name)
+        self.name_end.append(len(self.names))
+
+    def name(self, idx):
+        ''' Name of member idx '''
+        start = self.name_end[idx - 1] if idx else 0
+        return self.names[start:self.name_end[idx]].tobytes().decode("utf8", "replace")
+
+    def find(self, name):
+        ''' Member number of name (the last, if repeated) '''
+        if self.by_name is None:
+            self.by_name = {self.name(idx): idx for idx in range(len(self))}
+        return self.by_name[name]
+
+    def member(self, octets, name):
+        ''' The contents of a member, without copying '''
+        idx = self.find(name)
+        start = self.member_offset[idx]
+        return memoryview(octets)[start:start + self.member_size[idx]]
+
+def octal(field):
+    ''' Numeric header field, octal or GNU base-256 '''
+    if field[0] & 0x80:
+        return int.from_bytes(field[1:], "big") | ((field[0] & 0x3f) << (8 * (len(field) - 1)))
+    text = field.strip(b' \x00')
+    if not text:
+        return 0
+    return int(text, 8)
+
+def header_sum(header, signed=False):
+    ''' Header checksum, with the checksum field counted as spaces '''
+    total = sum(header) - sum(header[148:156]) + 8 * 32
+    if signed:
+        # Some old tars summed signed chars
+        high = len(header.translate(None, ASCII)) - len(header[148:156].translate(None, ASCII))
+        total -= 256 * high
+    return total
+
+def pax_records(data):
+    ''' Parse pax extended header records, ValueError if malformed '''
+    records = {}
+    ptr = 0
+    while ptr < len(data):
+        space = data.index(b' ', ptr)
+        reclen = int(data[ptr:space])
+        if reclen <= space - ptr or ptr + reclen > len(data):
+            raise ValueError("Bad pax record length")
+        key, _eq, value = data[space + 1:ptr + reclen - 1].partition(b'=')
+        records[key] = value
+        ptr += reclen
+    return records
+
+class Tar(FileFormat):
+    ''' ... '''
+
+    EXTENSION = "tar"
+    ACCESS = "sequential"
+
+    @classmethod
+    def probe(cls, head, tail, length):
+        if len(head) < BLOCK:
+            return 0
+        if head[257:262] == b'ustar':
+            return 100
+        header = head[:BLOCK]
+        try:
+            chksum = octal(header[148:156])
+        except ValueError:
+            return 0
+        if header != ZERO_BLOCK and chksum == header_sum(header):
+            return 80
+        return 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.index = None
+
+    def validate(self, save_index=False, **kwargs):
+        yield from super().validate(**kwargs)
+        self.need(BLOCK)
+
+        index = MemberIndex()
+        with memoryview(self.octets) as octets:
+            for err in self.walk_headers(octets, index):
+                yield err
+                return
+
+        self.index = index
+        self.mdi.artifact.index = index
+        self.mdi.artifact.statistics["tar"] = {
+            "members": len(index),
+            "octets": sum(index.member_size),
+        }
+        if save_index:
+            self.mdi.artifact.save_index()
+
+    def walk_headers(self, octets, index):
+        ''' Walk the headers '''
+        length = len(octets)
+        ptr = 0
+        longname = None
+        pax = {}
+        pax_header = None
+        while ptr + BLOCK <= length:
+            header = octets[ptr:ptr + BLOCK].tobytes()
+            if header == ZERO_BLOCK:
+                break
+            try:
+                chksum = octal(header[148:156])
+                size = octal(header[124:136])
+            except ValueError:
+                yield FileFormatError("TAR: Bad numeric field in header at 0x%x" % ptr)
+                return
+            if chksum != header_sum(header) and chksum != header_sum(header, signed=True):
+                yield FileFormatError("TAR: Bad header checksum at 0x%x" % ptr)
+                return
+
+            data = ptr + BLOCK
+            ptr = data + (size + BLOCK - 1) // BLOCK * BLOCK
+            if ptr > length:
+                yield FileFormatError("TAR: Member at 0x%x truncated" % (data - BLOCK))
+                return
+
+            typeflag = header[156]
+            if typeflag in (GNU_LONGNAME, GNU_LONGLINK, PAX_HEADER, PAX_GLOBAL):
+                if typeflag == GNU_LONGNAME:
+                    longname = octets[data:data + size].tobytes().rstrip(b'\x00')
+                elif typeflag == PAX_HEADER:
+                    try:
+                        pax = pax_records(octets[data:data + size].tobytes())
+                        pax_header = data - BLOCK
+                    except ValueError:
+                        yield FileFormatError("TAR: Bad pax header at 0x%x" % (data - BLOCK))
+                        return
+                continue
+
+            if longname is not None:
+                name = longname
+            elif b'path' in pax:
+                name = pax[b'path']
+            else:
+                name = header[:100].split(b'\x00')[0]
+                if header[257:263] == b'ustar\x00' and header[345]:
+                    name = header[345:500].split(b'\x00')[0] + b'/' + name
+            if b'size' in pax:
+                # Size too large for the header, data follows this header
+                try:
+                    size = int(pax[b'size'])
+                except ValueError:
+                    size = -1
+                if size < 0:
+                    yield FileFormatError("TAR: Bad pax header at 0x%x" % pax_header)
+                    return
+                ptr = data + (size + BLOCK - 1) // BLOCK * BLOCK
+                if ptr > length:
+                    yield FileFormatError("TAR: Member at 0x%x truncated" % (data - BLOCK))
+                    return
+            index.add(data - BLOCK, data, size, typeflag, name)
+            longname = None
+            pax = {}
+
+        if octets[ptr:ptr + 2 * BLOCK] != ZERO_BLOCK * 2:
+            yield FileFormatError("TAR: No end-of-archive blocks (truncated ?)")
+            return
+        if octets[ptr + 2 * BLOCK:].tobytes().strip(b'\x00'):
+            yield FileFormatError("TAR: Non-zero data after end-of-archive")
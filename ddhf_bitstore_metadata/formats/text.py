@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2012-2021 Poul-Henning Kamp <phk@phk.freebsd.dk>
+# All rights reserved.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+'''
+    Text Formats
+    ============
+
+    The octets are translated through a table to 0 (good) or 1 (bad)
+    a chunk at a time, and runs of bad octets found with find(),
+    so only the bad octets cost anything in Python.  A single pass
+    is made, so streamed artifacts are not spooled.
+
+    Blank tape (NUL) is accepted by the parity checked formats, it
+    is leader and trailer, not characters.
+'''
+
+from ..internals.fileformatclass import FileFormat, FileFormatError
+from ..internals.exceptions import ShortFile
+
+# Octets per chunk
+CHUNK = 1 << 23
+
+SEVEN_BIT = bytes(range(0x80))
+
+def parity(octet):
+    ''' Number of bits set, modulo two '''
+    return bin(octet).count("1") & 1
+
+class CharacterSet(FileFormat):
+    ''' Base class, subclasses define BAD and WHAT '''
+
+    ACCESS = "sequential"
+
+    # 1 for octets which are not allowed
+    BAD = bytes(256)
+    WHAT = None
+    SCORE = 50
+
+    @classmethod
+    def probe(cls, head, tail, length):
+        if (head + tail).translate(cls.BAD).count(1):
+            return 0
+        return cls.SCORE
+
+    def validate(self, max_errors=20, **kwargs):
+        yield from super().validate(**kwargs)
+
+        # Ranges beyond max_errors are only counted
+        runs = []
+        more = 0
+        base = 0
+        for chunk in self.mdi.artifact.chunks(CHUNK):
+            flags = bytes(chunk).translate(self.BAD)
+            i = flags.find(1)
+            while i >= 0 and len(runs) <= max_errors:
+                j = flags.find(0, i)
+                if j < 0:
+                    j = len(flags)
+                if runs and runs[-1][1] == base + i:
+                    runs[-1][1] = base + j
+                else:
+                    runs.append([base + i, base + j])
+                i = flags.find(1, j)
+            if i >= 0:
+                more += flags.count(1, i)
+            base += len(flags)
+        if not base:
+            raise ShortFile("Artifact (at least) 1 bytes too short")
+        if len(runs) > max_errors:
+            after, last = runs.pop(-1)
+            more += last - after
+        bad = sum(j - i for i, j in runs) + more
+
+        for first, last in runs:
+            where = "offset 0x%x" % first
+            if last - 1 > first:
+                where += " … 0x%x" % (last - 1)
+            yield FileFormatError("%s (%s)" % (self.WHAT, where))
+        if more:
+            yield FileFormatError(
+                "%s (%d more octets from offset 0x%x)" % (self.WHAT, more, after)
+            )
+
+        self.mdi.artifact.statistics[self.__class__.__name__.lower()] = {
+            "octets": base,
+            "bad_octets": bad,
+        }
+
+class Ascii(CharacterSet):
+    ''' Seven bit ASCII '''
+
+    EXTENSION = "txt"
+    BAD = bytes(1 if i & 0x80 else 0 for i in range(256))
+    WHAT = "Not 7-bit ASCII"
+
+class Parity(CharacterSet):
+    ''' Base class for formats with parity in the eighth bit '''
+
+    @classmethod
+    def probe(cls, head, tail, length):
+        # Without the eighth bit it is more likely plain ASCII
+        if not (head + tail).translate(None, SEVEN_BIT):
+            return 0
+        return super().probe(head, tail, length)
+
+class AsciiEven(Parity):
+    ''' ASCII with even parity in the eighth bit '''
+
+    EXTENSION = "bin"
+    BAD = bytes(parity(i) for i in range(256))
+    WHAT = "Bad (even) parity"
+    SCORE = 60
+
+class AsciiOdd(Parity):
+    ''' ASCII with odd parity in the eighth bit '''
+
+    EXTENSION = "bin"
+    BAD = bytes(1 - parity(i) if i else 0 for i in range(256))
+    WHAT = "Bad (odd) parity"
+    SCORE = 60
+
+class GierText(Parity):
+    ''' GIER flexowriter code, odd parity over all eight channels '''
+
+    EXTENSION = "flx"
+    BAD = AsciiOdd.BAD
+    WHAT = "Bad (odd) parity"
+    # Same table as ASCII_ODD, which is the more likely
+    SCORE = 55
@@ -32,6 +32,11 @@
 
 import struct
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from ..internals.fileformatclass import FileFormat, FileFormatError
 
 VALID_FORMATS = (1, )
@@ -39,6 +44,15 @@ VALID_CHANNELS = (1, 2,)
 VALID_SAMPLE_RATE = (8000, 44100, 48000,)
 VALID_BITS_PER_SAMPLE = (8, 16,)
 
+# RF64/BW64 'ds64' chunk: riff size, data size, sample count, table length
+DS64 = struct.Struct("<QQQL")
+DS64_ENTRY = struct.Struct("<4sQ")
+
+# Optional sample analysis (needs numpy)
+ANALYSIS_CHUNK_FRAMES = 1 << 16
+SILENCE_LEVEL = 0.001           # Fraction of full scale (-60 dBFS)
+SILENCE_SECONDS = 2.0
+
 class RiffList():
     ''' "LIST" block '''
 
@@ -86,19 +100,143 @@ class WavFmt():
                     FileFormatError("WAV: %s %d not in %s" % (name, i[pos], str(valid)))
                 )
 
+class WavAnalysis():
+    '''
+       Audio health statistics of the b'data' chunk
+
+       The samples are mapped as a NumPy array straight over the
+       artifact, and processed in chunks of frames, so memory use
+       is bounded by the chunk size.
+    '''
+
+    def __init__(
+        self,
+        octets,
+        offset,
+        length,
+        fmt,
+        chunk_frames=ANALYSIS_CHUNK_FRAMES,
+        silence_level=SILENCE_LEVEL,
+        silence_seconds=SILENCE_SECONDS,
+    ):
+        nchan = fmt.num_channels
+        if fmt.bits_per_sample == 8:
+            samples = numpy.frombuffer(octets, numpy.uint8, length, offset)
+            full_scale = 128
+        else:
+            samples = numpy.frombuffer(octets, numpy.dtype("<i2"), length // 2, offset)
+            full_scale = 32768
+        samples = samples[:len(samples) - len(samples) % nchan].reshape(-1, nchan)
+        self.frames = len(samples)
+        self.sample_rate = fmt.sample_rate
+
+        peak = numpy.zeros(nchan, numpy.int64)
+        total = numpy.zeros(nchan, numpy.int64)
+        squares = numpy.zeros(nchan, numpy.float64)
+        clipped = numpy.zeros(nchan, numpy.int64)
+        level = silence_level * full_scale
+        min_frames = max(1, int(silence_seconds * fmt.sample_rate))
+        self.silences = []
+        pending = None
+
+        for base in range(0, self.frames, chunk_frames):
+            # One contiguous row per channel, reductions along rows are much faster
+            chunk = numpy.array(samples[base:base + chunk_frames].T, numpy.int64, order='C')
+            if fmt.bits_per_sample == 8:
+                chunk -= 128
+            clipped += ((chunk <= -full_scale) | (chunk >= full_scale - 1)).sum(axis=1)
+            total += chunk.sum(axis=1)
+            squares += numpy.einsum('ij,ij->i', chunk, chunk)
+            numpy.abs(chunk, out=chunk)
+            peak = numpy.maximum(peak, chunk.max(axis=1))
+
+            # Runs of frames where all channels are below the silence level
+            silent = (chunk <= level).all(axis=0)
+            edges = numpy.flatnonzero(numpy.diff(silent, prepend=False, append=False))
+            starts = edges[0::2] + base
+            ends = edges[1::2] + base
+            if pending is not None:
+                if len(starts) and starts[0] == base:
+                    starts[0] = pending
+                else:
+                    self.add_silence(pending, base, min_frames)
+                pending = None
+            if len(ends) and ends[-1] == base + len(silent):
+                pending = starts[-1]
+                starts = starts[:-1]
+                ends = ends[:-1]
+            keep = ends - starts >= min_frames
+            for start, end in zip(starts[keep], ends[keep]):
+                self.add_silence(start, end, min_frames)
+        if pending is not None:
+            self.add_silence(pending, self.frames, min_frames)
+
+        frames = max(self.frames, 1)
+        self.peak = peak / full_scale
+        self.rms = numpy.sqrt(squares / frames) / full_scale
+        self.dc_offset = total / frames / full_scale
+        self.clipped = clipped
+
+    def add_silence(self, start, end, min_frames):
+        ''' Record a silent span, if long enough '''
+        if end - start >= min_frames:
+            self.silences.append((int(start), int(end)))
+
+    def statistics(self, max_silences=20):
+        ''' Summary for Artifact.statistics '''
+        return {
+            "frames": self.frames,
+            "peak": [round(float(x), 4) for x in self.peak],
+            "rms": [round(float(x), 4) for x in self.rms],
+            "dc_offset": [round(float(x), 4) for x in self.dc_offset],
+            "clipped": [int(x) for x in self.clipped],
+            "silences": len(self.silences),
+            "silent_spans": [
+                "%.1f+%.1fs" % (start / self.sample_rate, (end - start) / self.sample_rate)
+                for start, end in self.silences[:max_silences]
+            ],
+        }
+
 class Wav(FileFormat):
     ''' ... '''
 
     EXTENSION = "wav"
+    ACCESS = "sequential"
 
-    def validate(self, **kwargs):
+    @classmethod
+    def probe(cls, head, tail, length):
+        if head[:4] in (b'RIFF', b'RF64', b'BW64') and head[8:12] == b'WAVE':
+            return 100
+        return 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fmt = None
+        self.data = None
+
+    def validate(self, wav_analysis=False, **kwargs):
         yield from super().validate(**kwargs)
+        errors = False
+        with memoryview(self.octets) as octets:
+            for err in self.walk_chunks(octets):
+                errors = True
+                yield err
+        if not wav_analysis or errors:
+            return
+        if numpy is None:
+            self.mdi.artifact.statistics["wav"] = {"analysis": "needs numpy"}
+            return
+        analysis = WavAnalysis(self.octets, self.data[0], self.data[1], self.fmt)
+        self.mdi.artifact.statistics["wav"] = analysis.statistics()
+
+    def walk_chunks(self, octets):
+        ''' Walk the RIFF chunks by offset, without copying any of them '''
 
         self.need(16)
 
-        i = struct.unpack("<4sL4s4s", self.octets[:16])
+        i = struct.unpack_from("<4sL4s4s", octets, 0)
 
-        if i[0] != b'RIFF':
+        if i[0] not in (b'RIFF', b'RF64', b'BW64'):
             yield FileFormatError("Not a WAV file (%s not b'RIFF')" % str(i[0]))
             return
 
@@ -106,24 +244,43 @@ class Wav(FileFormat):
             yield FileFormatError("Not a WAV file (%s not b'WAVE')" % str(i[2]))
             return
 
-        if i[3] != b'fmt ':
+        plen = i[1]
+        ds64 = None
+        sizes = {}
+        if i[0] != b'RIFF':
+            # RF64/BW64: 64 bit sizes live in the b'ds64' chunk
+            if i[3] != b'ds64':
+                yield FileFormatError("%s file starts with %s instead of b'ds64' chunk" % (
+                    str(i[0]), str(i[3])
+                ))
+                return
+            self.need(12 + 8 + DS64.size)
+            ds64 = DS64.unpack_from(octets, 12 + 8)
+            self.need(12 + 8 + DS64.size + ds64[3] * DS64_ENTRY.size)
+            for j in DS64_ENTRY.iter_unpack(
+                octets[12 + 8 + DS64.size:12 + 8 + DS64.size + ds64[3] * DS64_ENTRY.size]
+            ):
+                sizes[j[0]] = j[1]
+            sizes[b'data'] = ds64[1]
+            if plen == 0xffffffff:
+                plen = ds64[0]
+        elif i[3] != b'fmt ':
             yield FileFormatError("WAV file starts with %s instead of b'fmt ' chunk" % str(i[3]))
 
-        plen = i[1]
-        if i[1] & 1:
-            if len(self.octets) == 8 + i[1]:
+        if plen & 1:
+            if len(octets) == 8 + plen:
                 yield FileFormatError(
-                   "WAV file lacks pad byte (%d < %d)" % (len(self.octets), 9 + plen)
+                   "WAV file lacks pad byte (%d < %d)" % (len(octets), 9 + plen)
                 )
                 return
             plen += 1
 
-        if len(self.octets) < 8 + plen:
-            yield FileFormatError("WAV file too short (%d < %d)" % (len(self.octets), 8 + plen))
+        if len(octets) < 8 + plen:
+            yield FileFormatError("WAV file too short (%d < %d)" % (len(octets), 8 + plen))
             return
 
-        if len(self.octets) > 8 + plen:
-            yield FileFormatError("WAV file too long (%d > %d)" % (len(self.octets), 8 + plen))
+        if len(octets) > 8 + plen:
+            yield FileFormatError("WAV file too long (%d > %d)" % (len(octets), 8 + plen))
             return
 
         ptr = 12
@@ -131,30 +288,39 @@ class Wav(FileFormat):
         datalen = None
         fmt = None
         last = None
-        while ptr <= len(self.octets) - 8:
-            i = struct.unpack("<4sL", self.octets[ptr:ptr+8])
-            tptr = ptr + 8 + i[1]
-            if i[1] & 1:
+        while ptr <= len(octets) - 8:
+            i = struct.unpack_from("<4sL", octets, ptr)
+            clen = i[1]
+            if clen == 0xffffffff and i[0] in sizes:
+                clen = sizes[i[0]]
+            tptr = ptr + 8 + clen
+            if clen & 1:
                 tptr += 1
             last = i[0]
             if i[0] == b'data':
-                datalen = i[1]
+                datalen = clen
+                self.data = (ptr + 8, clen)
             elif i[0] == b'fmt ':
-                fmt = WavFmt(self.octets[ptr + 8:ptr + 8 + i[1]])
+                fmt = WavFmt(octets[ptr + 8:ptr + 8 + clen])
+                self.fmt = fmt
                 if fmt.complaints:
                     yield from fmt.complaints
-            elif i[0] == b'fact' and i[1] == 4:
-                fact = struct.unpack("<L", self.octets[ptr+8:ptr+8+i[1]])
-            elif i[0] == b'LIST' and self.octets[ptr+8:ptr+12] == b'INFO':
-                listinfo = RiffList(self.octets[ptr + 8:ptr + 8 + i[1]])
+            elif i[0] == b'fact' and clen == 4:
+                fact = struct.unpack_from("<L", octets, ptr + 8)
+                if fact[0] == 0xffffffff and ds64:
+                    fact = (ds64[2],)
+            elif i[0] == b'LIST' and octets[ptr + 8:ptr + 12] == b'INFO':
+                listinfo = RiffList(octets[ptr + 8:ptr + 8 + clen])
                 if listinfo.complaints:
                     yield from listinfo.complaints
+            elif i[0] == b'ds64' and ptr == 12 and ds64:
+                pass
             else:
                 yield FileFormatError("WAV chunk %s not allowed" % str(i[0]))
             ptr = tptr
 
-        if ptr != len(self.octets):
-            yield FileFormatError("WAV: Length inconsistency (%d != %d)" % (ptr, len(self.octets)))
+        if ptr != len(octets):
+            yield FileFormatError("WAV: Length inconsistency (%d != %d)" % (ptr, len(octets)))
 
         if datalen is None:
             yield FileFormatError("WAV: no b'data' chunk)")
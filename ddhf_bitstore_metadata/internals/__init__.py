@@ -35,5 +35,6 @@ from ..internals.fields import *
 from ..internals.section import Section
 from ..internals.metadata import Metadata
 from ..internals import syntax
-from ..internals.artifact import Artifact
+from ..internals.artifact import Artifact, ArtifactPool
 from ..internals.file_formats import FileFormats
+from ..internals.manifest_index import ManifestIndex
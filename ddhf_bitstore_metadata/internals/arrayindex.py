@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2012-2021 Poul-Henning Kamp <phk@phk.freebsd.dk>
+# All rights reserved.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+'''
+   Array-backed indices
+   --------------------
+
+   Base class for the compact indices validators build of the
+   structure of artifacts, which can be saved next to the artifact
+   so downstream tools need not parse it again.
+'''
+
+import sys
+import array
+import struct
+
+from ..internals.exceptions import FileFormatError
+
+LENGTH = struct.Struct("<Q")
+
+class ArrayIndex():
+    ''' A set of named arrays, saved little-endian '''
+
+    MAGIC = None
+    ARRAYS = ()
+
+    def __init__(self):
+        for name, typecode in self.ARRAYS:
+            setattr(self, name, array.array(typecode))
+
+    def save(self, filename):
+        ''' Save index '''
+        with open(filename, "wb") as file:
+            file.write(self.MAGIC)
+            for name, _typecode in self.ARRAYS:
+                arr = getattr(self, name)
+                file.write(LENGTH.pack(len(arr)))
+                if sys.byteorder != "little":
+                    arr = array.array(arr.typecode, arr)
+                    arr.byteswap()
+                arr.tofile(file)
+
+    @classmethod
+    def load(cls, filename):
+        ''' Load a saved index '''
+        index = cls()
+        with open(filename, "rb") as file:
+            if file.read(len(cls.MAGIC)) != cls.MAGIC:
+                raise FileFormatError("Not a %s file: %s" % (cls.__name__, filename))
+            for name, _typecode in cls.ARRAYS:
+                arr = getattr(index, name)
+                arr.fromfile(file, LENGTH.unpack(file.read(LENGTH.size))[0])
+                if sys.byteorder != "little":
+                    arr.byteswap()
+        return index
@@ -31,11 +31,93 @@
    --------------
 
    Provides validators (optional) access to the artifact.
+
+   The artifact can be a plain file, a buffer (for instance a member
+   of a Zip or tar file) or a stream (a pipe, or a compressed member).
+
+   Validators which need random access use buffer(), which maps
+   plain files and spools streams to a temporary file.  Validators
+   which can do with a single sequential pass use chunks(), which
+   never holds more than a chunk of a stream.
+
+   Validators declare how they read the artifact (FileFormat.ACCESS)
+   and the kernel is told through posix_fadvise() and madvise().
+   Sequential scans of big files with chunks() are streamed with
+   pread() instead of being mapped, small files are mapped and read
+   ahead in full.
+
+   Artifacts are context managers, close() releases the file, the
+   mapping, the spool and any ZipFile.  Artifacts opened by filename
+   through an ArtifactPool are released when they are the least
+   recently used beyond the pool's limit, and transparently reopened
+   when used again, so a long batch holds a bounded number of files
+   and mappings.
 '''
 
+import io
 import os
 import mmap
+import collections
+import stat
+import shutil
 import zipfile
+import tempfile
+
+from ..internals.zipdir import ZipDirectory, ZipMember
+from ..internals.file_formats import FileFormats, SNIFF_HEAD, SNIFF_TAIL
+
+CHUNK_SIZE = 1 << 20
+
+# Open artifacts kept by an ArtifactPool
+DEFAULT_MAX_OPEN = 64
+
+# Sequential scans of files this big are streamed with pread(), not mapped
+PREAD_MIN_SIZE = 32 << 20
+
+# Read ahead no more than this at once, more was measured to slow scans down
+WILLNEED_MAX_SIZE = 16 << 20
+
+# FileFormat.ACCESS to posix_fadvise() and madvise() advice
+if hasattr(os, "posix_fadvise"):
+    FADVICE = {
+        "sequential": os.POSIX_FADV_SEQUENTIAL,
+        "random": os.POSIX_FADV_RANDOM,
+    }
+else:
+    FADVICE = {}
+if hasattr(mmap, "MADV_SEQUENTIAL"):
+    MADVICE = {
+        "sequential": mmap.MADV_SEQUENTIAL,
+        "random": mmap.MADV_RANDOM,
+    }
+else:
+    MADVICE = {}
+
+def map_file(file, length):
+    ''' Map a plain file read-only '''
+    if not length:
+        return b''
+    return mmap.mmap(
+        file.fileno(),
+        length,
+        flags=mmap.MAP_PRIVATE,
+        prot=mmap.PROT_READ
+    )
+
+def read_full(file, size):
+    ''' Read size octets, unless EOF, pipes return short reads '''
+    chunk = file.read(size)
+    if len(chunk) in (0, size):
+        return chunk
+    chunks = [chunk]
+    have = len(chunk)
+    while have < size:
+        chunk = file.read(size - have)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        have += len(chunk)
+    return b''.join(chunks)
 
 class Artifact():
     ''' Accessor class for artifacts '''
@@ -49,27 +131,244 @@ class Artifact():
             self.aa_id = None
         self.artifact = None
         self.zipfile = None
+        self.zipdir = None
         self.octets = None
         self.length = None
+        self.statistics = {}
+        self.index = None
+        self.candidates = None
+        self.stream = None
+        self.consumed = False
+        self.spool = None
+        self.filename = None
+        self.pool = None
+        self.access = None
 
-    def open_artifact(self, file=None):
-        ''' Open the artifact '''
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
+
+    def open_file(self, filename, pool=None):
+        ''' Open the artifact by filename, through the pool if given '''
+        self.filename = filename
+        self.pool = pool
+        self.reopen()
+
+    def reopen(self):
+        ''' (Re)open a file artifact released by its pool '''
+        if self.octets is None and self.artifact is None and self.stream is None:
+            self.open_artifact(open(self.filename, "rb"))
+        if self.pool is not None and self.artifact is not None:
+            # Streams cannot be reopened, so they are not pooled
+            self.pool.touch(self)
+
+    def release(self):
+        '''
+           Drop the file, the mapping and what depends on them.
+
+           The mapping is not closed: a validator still holding it, or
+           a view of it, keeps it alive until it is done with it.
+        '''
+        if self.zipfile is not None:
+            self.zipfile.close()
+            self.zipfile = None
+        self.zipdir = None
+        self.octets = None
         if self.artifact is not None:
+            self.artifact.close()
+            self.artifact = None
+
+    def close(self):
+        ''' Close everything the artifact holds '''
+        octets = self.octets
+        self.release()
+        if isinstance(octets, memoryview):
+            octets.release()
+        elif isinstance(octets, mmap.mmap):
+            try:
+                octets.close()
+            except BufferError:
+                # Views are still exported, the mapping goes with the last of them
+                pass
+        if self.spool is not None:
+            self.spool.close()
+            self.spool = None
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        if self.pool is not None:
+            self.pool.forget(self)
+            self.pool = None
+        self.filename = None
+
+    def open_artifact(self, file=None):
+        ''' Open the artifact, mapped if a plain file, otherwise streamed '''
+        if self.artifact is not None or self.octets is not None or self.stream is not None:
             return
+        try:
+            status = os.fstat(file.fileno())
+        except (AttributeError, io.UnsupportedOperation):
+            status = None
+        if status is None or not stat.S_ISREG(status.st_mode):
+            self.open_stream(file)
+            return
+        # Mapped when first needed, sequential scans may not need to
         self.artifact = file
-        self.length = os.fstat(file.fileno()).st_size
-        self.octets = mmap.mmap(
-            file.fileno(),
-            self.length,
-            flags=mmap.MAP_PRIVATE,
-            prot=mmap.PROT_READ
-        )
+        self.length = status.st_size
+        self.advise(self.access)
+
+    def open_buffer(self, octets):
+        ''' Open an artifact already in a buffer (bytes, mmap, memoryview) '''
+        self.octets = octets
+        self.length = len(octets)
+
+    def open_stream(self, file, length=None):
+        ''' Open an artifact which can only be read sequentially '''
+        self.stream = file
+        self.length = length
+
+    def open_zip_member(self, container, entry):
+        ''' Open a Zip member: a slice of the container if stored, else streamed '''
+        container.open_bagit()
+        if entry.compress_type == zipfile.ZIP_STORED and not entry.flag_bits & 0x1:
+            start, end = container.zipdir.data_span(entry)
+            self.open_buffer(memoryview(container.buffer())[start:end])
+        else:
+            self.open_stream(container.open_member(entry), entry.file_size)
+
+    def open_tar_member(self, container, index, name):
+        ''' Open a tar member, using the container's MemberIndex '''
+        self.open_buffer(index.member(container.buffer(), name))
+
+    def random_access(self):
+        ''' Is the artifact available without spooling '''
+        return self.octets is not None or self.artifact is not None
+
+    def advise(self, access):
+        ''' Tell the kernel how the artifact will be read, see FileFormat.ACCESS '''
+        self.access = access
+        if self.artifact is not None and access in FADVICE:
+            os.posix_fadvise(self.artifact.fileno(), 0, 0, FADVICE[access])
+        if isinstance(self.octets, mmap.mmap) and access in MADVICE:
+            self.octets.madvise(MADVICE[access])
+            if access == "sequential" and self.length <= WILLNEED_MAX_SIZE:
+                self.octets.madvise(mmap.MADV_WILLNEED)
+
+    def read_ahead(self, start, length):
+        ''' We will soon read this much from start, if it is a file '''
+        length = min(length, WILLNEED_MAX_SIZE)
+        if self.artifact is not None and hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(self.artifact.fileno(), start, length, os.POSIX_FADV_WILLNEED)
+        elif isinstance(self.octets, mmap.mmap) and hasattr(mmap, "MADV_WILLNEED"):
+            page = start - start % mmap.PAGESIZE
+            self.octets.madvise(mmap.MADV_WILLNEED, page, length + start - page)
+
+    def buffer(self):
+        ''' Random access to the artifact, streams are spooled to a temporary file '''
+        if self.filename is not None:
+            self.reopen()
+        if self.octets is None and self.artifact is not None:
+            self.octets = map_file(self.artifact, self.length)
+            self.advise(self.access)
+        if self.octets is None and self.stream is not None:
+            assert not self.consumed, "Stream already read"
+            self.consumed = True
+            spool = tempfile.TemporaryFile()
+            shutil.copyfileobj(self.stream, spool, CHUNK_SIZE)
+            spool.flush()
+            self.length = spool.tell()
+            self.octets = map_file(spool, self.length)
+            self.spool = spool
+        return self.octets
+
+    def chunks(self, size=CHUNK_SIZE):
+        ''' Yield the artifact in chunks of size octets, only the last may be shorter '''
+        if self.filename is not None:
+            self.reopen()
+        if self.octets is None and self.artifact is not None:
+            if self.access == "sequential" and self.length >= PREAD_MIN_SIZE:
+                yield from self.pread_chunks(size)
+                return
+            self.buffer()
+        if self.octets is not None:
+            octets = memoryview(self.octets)
+            for ptr in range(0, len(octets), size):
+                yield octets[ptr:ptr + size]
+            return
+        assert not self.consumed, "Stream already read"
+        self.consumed = True
+        length = 0
+        while True:
+            chunk = read_full(self.stream, size)
+            length += len(chunk)
+            if chunk:
+                yield chunk
+            if len(chunk) < size:
+                break
+        self.length = length
+
+    def pread_chunks(self, size):
+        ''' Stream a file with pread(), on our own descriptor in case a pool releases the file '''
+        fd = os.dup(self.artifact.fileno())
+        try:
+            for ptr in range(0, self.length, size):
+                chunk = os.pread(fd, size, ptr)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            os.close(fd)
+
+    def save_index(self):
+        ''' Save the index next to the artifact, if it is a file '''
+        if self.index is not None and self.filename is not None:
+            self.index.save(self.filename + ".idx")
+        elif self.index is not None and self.artifact is not None:
+            self.index.save(self.artifact.name + ".idx")
+
+    def ends(self):
+        ''' What the probes get to see, files are not mapped for that '''
+        if self.octets is None and self.artifact is not None:
+            fd = self.artifact.fileno()
+            return (
+                os.pread(fd, SNIFF_HEAD, 0),
+                os.pread(fd, SNIFF_TAIL, max(0, self.length - SNIFF_TAIL)),
+                self.length,
+            )
+        return FileFormats.ends(self.buffer())
+
+    def probe(self, fmt):
+        ''' How well the artifact matches the signature of fmt '''
+        return FileFormats.get(fmt).probe(*self.ends())
+
+    def sniff(self):
+        ''' Formats the artifact could be, best first '''
+        if self.candidates is None:
+            self.candidates = FileFormats.sniff_ends(self.ends())
+            self.statistics["sniff"] = dict((fmt, score) for score, fmt in self.candidates)
+        return self.candidates
 
     def open_bagit(self):
         ''' Open Zip/Bagit file '''
-        self.open_artifact()
+        if self.zipdir is None:
+            self.zipdir = ZipDirectory(self.buffer())
+
+    def open_member(self, entry):
+        ''' Open an independent streamed reader for a Zip/Bagit member '''
+        self.open_bagit()
+        start, end = self.zipdir.data_span(entry)
+        self.read_ahead(start, end - start)
+        if not entry.flag_bits & 0x1:
+            try:
+                return ZipMember(self.zipdir, entry)
+            except NotImplementedError:
+                pass
+        # Leave the exotic stuff to zipfile
         if self.zipfile is None:
-            self.zipfile = zipfile.ZipFile(self.artifact)
+            self.zipfile = zipfile.ZipFile(self.artifact or self.spool or io.BytesIO(self.buffer()))
+        return self.zipfile.open(entry.filename)
 
     def bagit_contents(self):
         ''' Yield payload filenames of Bagit file '''
@@ -79,6 +378,50 @@ class Artifact():
         prefix = basename + "/data/"
         lprefix = len(prefix)
         self.open_bagit()
-        for zname in self.zipfile.namelist():
-            if len(zname) > lprefix and zname[:lprefix] == prefix:
+        for _ptr, zname in self.zipdir.walk(prefix):
+            if len(zname) > lprefix:
                 yield zname[lprefix:]
+
+class ArtifactPool():
+    '''
+       Keeps at most max_open file artifacts open, each holding a file
+       and a mapping, releasing the least recently used ones.
+    '''
+
+    def __init__(self, max_open=DEFAULT_MAX_OPEN):
+        assert max_open > 0
+        self.max_open = max_open
+        self.lru = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.lru)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
+
+    def open(self, mdata, filename):
+        ''' An artifact for filename, opened through this pool '''
+        artifact = Artifact(mdata)
+        artifact.open_file(filename, self)
+        return artifact
+
+    def touch(self, artifact):
+        ''' The artifact is in use, make room for it '''
+        self.lru[id(artifact)] = artifact
+        self.lru.move_to_end(id(artifact))
+        while len(self.lru) > self.max_open:
+            _key, victim = self.lru.popitem(last=False)
+            victim.release()
+
+    def forget(self, artifact):
+        ''' The artifact is closed '''
+        self.lru.pop(id(artifact), None)
+
+    def close(self):
+        ''' Release all the artifacts in the pool '''
+        while self.lru:
+            _key, artifact = self.lru.popitem()
+            artifact.release()
@@ -26,106 +26,166 @@
 # OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
 # SUCH DAMAGE.
 
-
-'''
-    Fileformats - fall-back if ddhf_bitstore_fileformats not installed
-    ==================================================================
 '''
+    Fileformats - registry of the file format validators
+    =====================================================
 
-from ..internals.fileformatclass import FileFormat
+    The validators are only imported when needed, a plain metadata
+    check imports none and an artifact check only its own format.
 
-from ..formats.imagedisk import ImageDisk
-from ..formats.bagit import BagIt
-from ..formats.simh_crd import SimhCrd
-from ..formats.wav import Wav
+    Formats from other packages are found through the entry points
+    in the group "ddhf_bitstore_metadata.formats", named by format
+    and pointing to a FileFormat subclass:
 
-class Ascii(FileFormat):
-    ''' ... '''
-    EXTENSION = "txt"
+        entry_points={
+            "ddhf_bitstore_metadata.formats": [
+                "FOOBAR = site_formats.foobar:FooBar",
+            ],
+        }
 
-class AsciiEven(FileFormat):
-    ''' ... '''
-    EXTENSION = "bin"
+    An entry point with the name of a builtin format replaces it.
+'''
 
-class AsciiOdd(FileFormat):
-    ''' ... '''
-    EXTENSION = "bin"
+import importlib
 
-class GierText(FileFormat):
-    ''' ... '''
-    EXTENSION = "flx"
+from ..internals.fileformatclass import FileFormat
+
+ENTRY_POINT_GROUP = "ddhf_bitstore_metadata.formats"
+
+# Name: ("module:class", extension), the extension is here so
+# checking metadata does not import the format
+BUILTIN_FORMATS = {
+    'ASCII': ('.formats.text:Ascii', 'txt'),
+    'ASCII_EVEN': ('.formats.text:AsciiEven', 'bin'),
+    'ASCII_ODD': ('.formats.text:AsciiOdd', 'bin'),
+    'BAGIT': ('.formats.bagit:BagIt', 'zip'),
+    'BINARY': ('.internals.file_formats:Binary', 'bin'),
+    'SIMH-CRD': ('.formats.simh_crd:SimhCrd', 'crd'),
+    'GIERTEXT': ('.formats.text:GierText', 'flx'),
+    'IMAGEDISK': ('.formats.imagedisk:ImageDisk', 'imd'),
+    'ISO9660': ('.formats.iso9660:Iso', 'iso'),
+    'JPG': ('.formats.jpeg:JPG', 'jpg'),
+    'KRYOFLUX': ('.formats.kryoflux:KryoFlux', 'zip'),
+    'MP4': ('.formats.mp4:MP4', 'mp4'),
+    'PDF': ('.formats.pdf:PDF', 'pdf'),
+    'PNG': ('.formats.png:PNG', 'png'),
+    'SIMH-TAP': ('.formats.simh_tap:SimhTap', 'tap'),
+    'TAR': ('.formats.tar:Tar', 'tar'),
+    'WAV': ('.formats.wav:Wav', 'wav'),
+}
+
+# Octets at each end of the artifact the probes see,
+# the head covers the ISO9660 volume descriptors.
+SNIFF_HEAD = 40 << 10
+SNIFF_TAIL = 8 << 10
 
 class Binary(FileFormat):
     ''' ... '''
     EXTENSION = "bin"
 
-class Iso(FileFormat):
-    ''' ... '''
-    EXTENSION = "iso"
-
-class JPG(FileFormat):
-    ''' ... '''
-    EXTENSION = "jpg"
-
-class KryoFlux(FileFormat):
-    ''' ... '''
-    EXTENSION = "zip"
-
-class MP4(FileFormat):
-    ''' ... '''
-    EXTENSION = "mp4"
-
-class PDF(FileFormat):
-    ''' ... '''
-    EXTENSION = "pdf"
-
-class PNG(FileFormat):
-    ''' ... '''
-    EXTENSION = "png"
-
-class SimhTap(FileFormat):
-    ''' ... '''
-    EXTENSION = "tap"
-
-class Tar(FileFormat):
-    ''' ... '''
-    EXTENSION = "tar"
+    @classmethod
+    def probe(cls, _head, _tail, _length):
+        # Anything is binary
+        return 1
+
+def entry_points():
+    ''' The entry points in our group '''
+    # Not imported at the top, it is slow
+    import importlib.metadata    # pylint: disable=import-outside-toplevel
+    eps = importlib.metadata.entry_points()
+    if hasattr(eps, "select"):
+        return eps.select(group=ENTRY_POINT_GROUP)
+    # Python < 3.10
+    return eps.get(ENTRY_POINT_GROUP, ())
 
 class Fileformats():
-    ''' Fallback file format check, if ddhf_bitstore_fileformats not installed '''
-
-    OK_LIST = {
-        'ASCII': Ascii,
-        'ASCII_EVEN': AsciiEven,
-        'ASCII_ODD': AsciiOdd,
-        'BAGIT': BagIt,
-        'BINARY': Binary,
-        'SIMH-CRD': SimhCrd,
-        'GIERTEXT': GierText,
-        'IMAGEDISK': ImageDisk,
-        'ISO9660': Iso,
-        'JPG': JPG,
-        'KRYOFLUX': KryoFlux,
-        'MP4': MP4,
-        'PDF': PDF,
-        'PNG': PNG,
-        'SIMH-TAP': SimhTap,
-        'TAR': Tar,
-        'WAV': Wav,
-    }
+    ''' Lazy registry of file formats '''
+
+    def __init__(self):
+        self.specs = None
+        self.extensions = None
+        self.classes = {}
+
+    def registry(self):
+        ''' Format name to "module:class" or entry point, discovered on first use '''
+        if self.specs is None:
+            self.specs = dict((name, spec) for name, (spec, _ext) in BUILTIN_FORMATS.items())
+            self.extensions = dict((name, ext) for name, (_spec, ext) in BUILTIN_FORMATS.items())
+            for entry_point in entry_points():
+                self.specs[entry_point.name] = entry_point
+                self.extensions.pop(entry_point.name, None)
+        return self.specs
 
     def __contains__(self, what):
-        return what in self.OK_LIST
+        return what in self.registry()
+
+    def __iter__(self):
+        yield from self.registry()
+
+    def get(self, what):
+        ''' The FileFormat class for a format, imported if necessary '''
+        cls = self.classes.get(what)
+        if cls is None:
+            spec = self.registry()[what]
+            if isinstance(spec, str):
+                module, _colon, name = spec.partition(":")
+                cls = getattr(importlib.import_module(module, __package__.rpartition(".")[0]), name)
+            else:
+                cls = spec.load()
+            assert issubclass(cls, FileFormat), spec
+            assert self.extensions.get(what, cls.EXTENSION) == cls.EXTENSION, spec
+            self.classes[what] = cls
+        return cls
 
     def get_extension(self, what):
-        ''' Appropriate extension for this format '''
-        return self.OK_LIST[what].EXTENSION
+        ''' Appropriate extension for this format, only plugins are imported for this '''
+        self.registry()
+        extension = self.extensions.get(what)
+        if extension is None:
+            extension = self.get(what).EXTENSION
+        return extension
+
+    def with_extension(self, extension):
+        ''' The formats using extension '''
+        return [fmt for fmt in self if self.get_extension(fmt) == extension]
+
+    def probe(self, what, octets):
+        ''' How well octets match the signature of one format '''
+        return self.get(what).probe(*self.ends(octets))
+
+    def sniff(self, octets):
+        '''
+           Return [(score, format), …] best first, for the formats octets could be
+
+           This imports all the formats.
+        '''
+        return self.sniff_ends(self.ends(octets))
+
+    def sniff_ends(self, ends):
+        ''' Like sniff() but for what ends() returned '''
+        candidates = []
+        for fmt in self:
+            score = self.get(fmt).probe(*ends)
+            if score:
+                candidates.append((score, fmt))
+        candidates.sort(key=lambda x: -x[0])
+        return candidates
+
+    @staticmethod
+    def ends(octets):
+        ''' What the probes get to see '''
+        length = len(octets)
+        return bytes(octets[:SNIFF_HEAD]), bytes(octets[max(0, length - SNIFF_TAIL):]), length
 
     def litany(self, mdi, **kwargs):
         ''' Yield a litany of complaints '''
         assert mdi.artifact
         fmt = mdi.BitStore.Format.val
-        # fmt = "BAGIT"
-        yield from self.OK_LIST[fmt](mdi).litany(**kwargs)
+        if fmt not in self:
+            # Already complained about
+            return
+        cls = self.get(fmt)
+        mdi.artifact.advise(cls.ACCESS)
+        yield from cls(mdi).litany(**kwargs)
 
 FileFormats = Fileformats()
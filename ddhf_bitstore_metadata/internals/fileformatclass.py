@@ -40,15 +40,27 @@ class FileFormat():
 
     EXTENSION = None
 
+    # How validate() reads the artifact: "sequential", "random" or None
+    ACCESS = None
+
     def __init__(self, mdi):
         self.mdi = mdi
-        self.octets = mdi.artifact.octets
+
+    @property
+    def octets(self):
+        ''' Random access to the artifact '''
+        return self.mdi.artifact.buffer()
+
+    @classmethod
+    def probe(cls, _head, _tail, _length):
+        '''
+           How well the first and last octets of an artifact match
+           this format: 0 not at all … 100 certain
+        '''
+        return 0
 
     def need(self, length):
         ''' Complain if artifict not at least this long '''
-        if self.octets is None:
-            self.mdi.artifact.open_artifact()
-            self.octets = self.mdi.artifact.octets
         if length > len(self.octets):
             raise ShortFile("Artifact (at least) %d bytes too short" % (length - len(self.octets)))
 
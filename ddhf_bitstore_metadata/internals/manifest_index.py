@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2012-2021 Poul-Henning Kamp <phk@phk.freebsd.dk>
+# All rights reserved.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+'''
+   BagIt manifest index
+   --------------------
+
+   Persistent (SQLite) index of (ident, path) -> (sha256, size) for
+   the payload of all BagIt artifacts validated, so questions like
+   "which bags contain this file" can be answered without opening
+   any zip files.
+'''
+
+import sqlite3
+
+DEFAULT_FILENAME = "_bagit_manifest.sqlite3"
+
+class ManifestIndex():
+    ''' Manifest index database '''
+
+    def __init__(self, filename=DEFAULT_FILENAME):
+        self.filename = filename
+        self.db = sqlite3.connect(filename)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS manifest ("
+            " ident TEXT NOT NULL,"
+            " path TEXT NOT NULL,"
+            " sha256 TEXT NOT NULL,"
+            " size INTEGER,"
+            " PRIMARY KEY (ident, path)"
+            ")"
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS manifest_sha256 ON manifest (sha256)"
+        )
+        self.db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
+
+    def close(self):
+        ''' Close the database '''
+        self.db.close()
+
+    def update(self, ident, entries):
+        ''' Replace all entries for ident with (path, sha256, size) tuples '''
+        with self.db:
+            self.db.execute("DELETE FROM manifest WHERE ident = ?", (ident,))
+            self.db.executemany(
+                "INSERT INTO manifest (ident, path, sha256, size) VALUES (?, ?, ?, ?)",
+                ((ident, path, sha256, size) for path, sha256, size in entries),
+            )
+
+    def bags_containing(self, sha256):
+        ''' Yield (ident, path) for all payload files with this digest '''
+        yield from self.db.execute(
+            "SELECT ident, path FROM manifest WHERE sha256 = ? ORDER BY ident, path",
+            (sha256,),
+        )
+
+    def duplicates(self):
+        ''' Yield (sha256, size, [(ident, path), ...]) for payloads in more than one place '''
+        dups = self.db.execute(
+            "SELECT sha256, MAX(size) FROM manifest"
+            " GROUP BY sha256 HAVING COUNT(*) > 1 ORDER BY sha256"
+        ).fetchall()
+        for sha256, size in dups:
+            yield sha256, size, list(self.bags_containing(sha256))
@@ -31,6 +31,9 @@
    -------------------
 '''
 
+import os
+import types
+
 from ..internals import artifact
 from ..internals import section
 from ..internals import exceptions
@@ -68,6 +71,12 @@ class MetadataBase():
                 self.sections[full_sect] = sect
             sect.add_field(stanza)
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
+
     def __str__(self):
         try:
             return self.BitStore.Ident.val
@@ -97,6 +106,11 @@ class MetadataBase():
         assert isinstance(accessor, artifact.Artifact)
         self.artifact = accessor
 
+    def close(self):
+        ''' Close the artifact, if any '''
+        if self.artifact is not None:
+            self.artifact.close()
+
     def allow_keyword_proposals(self, ok):
         ''' Allow unrecognized keywords '''
         self.keyword_proposals_allowed = ok
@@ -134,7 +148,7 @@ class Metadata(MetadataBase):
     Mostly a convenience wrapper
     '''
 
-    def __init__(self, *args, filename=None, artifact_file=None, **kwargs):
+    def __init__(self, *args, filename=None, artifact_file=None, pool=None, **kwargs):
         if filename is not None:
             with open(filename, encoding="utf8") as file:
                 super().__init__(file.read(), *args, **kwargs)
@@ -142,5 +156,25 @@ class Metadata(MetadataBase):
             super().__init__(*args, **kwargs)
         if artifact_file is not None:
             i = artifact.Artifact(self)
-            i.open_artifact(open(artifact_file, "rb"))
+            i.open_file(artifact_file, pool)
             self.add_accessor(i)
+
+class MemberMetadata():
+    '''
+    Stand-in metadata for an artifact inside another artifact,
+    with only the BitStore fields the validators use.
+    '''
+
+    def __init__(self, filename, fmt, size):
+        self.BitStore = types.SimpleNamespace(
+            Filename=types.SimpleNamespace(val=os.path.basename(filename)),
+            Format=types.SimpleNamespace(val=fmt),
+            Size=types.SimpleNamespace(val=str(size)),
+            Digest=types.SimpleNamespace(val=None),
+            Ident=types.SimpleNamespace(val=None),
+        )
+        self.artifact = None
+
+    def add_accessor(self, accessor):
+        ''' Add accessor for the artifact '''
+        self.artifact = accessor
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2012-2021 Poul-Henning Kamp <phk@phk.freebsd.dk>
+# All rights reserved.
+#
+# SPDX-License-Identifier: BSD-2-Clause
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+'''
+   Zip central directory
+   ---------------------
+
+   Lean reader for the central directory of a Zip file which is
+   already mapped into memory.  The directory is checked in a single
+   pass when opened, but unlike zipfile.ZipFile only an index of
+   record offsets is kept, entries are decoded while iterating,
+   optionally filtered on a filename prefix before decoding.
+
+   Zip64 is supported, encryption and other exotica are left to
+   zipfile.
+'''
+
+import struct
+import zlib
+import zipfile
+
+EOCD = struct.Struct("<4s4H2LH")
+ZIP64_LOCATOR = struct.Struct("<4sLQL")
+ZIP64_EOCD = struct.Struct("<4sQ2H2L4Q")
+CENTRAL_DIR = struct.Struct("<4s4B4HL2L5H2L")
+LOCAL_HEADER = struct.Struct("<4s5HL2L2H")
+
+class ZipEntry():
+    ''' One central directory entry, attribute compatible with zipfile.ZipInfo '''
+
+    __slots__ = (
+        "filename",
+        "flag_bits",
+        "compress_type",
+        "CRC",
+        "compress_size",
+        "file_size",
+        "header_offset",
+    )
+
+    def __repr__(self):
+        return "<ZipEntry %s>" % self.filename
+
+    def is_dir(self):
+        ''' Directory entries end in slash '''
+        return self.filename[-1:] == '/'
+
+class ZipDirectory():
+    ''' Central directory of a mapped Zip file '''
+
+    def __init__(self, octets):
+        self.octets = octets
+
+        # The EOCD record is at the end, followed by up to 64k comment
+        tail = max(0, len(octets) - EOCD.size - 0xffff)
+        eocd = bytes(octets[tail:]).rfind(b'PK\x05\x06')
+        if eocd >= 0:
+            eocd += tail
+        if eocd < 0 or eocd + EOCD.size > len(octets):
+            raise zipfile.BadZipFile("No end of central directory record")
+        rec = EOCD.unpack_from(octets, eocd)
+        self.count = rec[4]
+        cd_size = rec[5]
+        cd_offset = rec[6]
+        cd_end = eocd
+
+        loc = eocd - ZIP64_LOCATOR.size
+        if loc >= 0 and octets[loc:loc + 4] == b'PK\x06\x07':
+            # The locator's offset is wrong if data was prepended, so
+            # like zipfile expect the record right before the locator
+            if loc < ZIP64_EOCD.size:
+                raise zipfile.BadZipFile("Bad Zip64 end of central directory locator")
+            rec = ZIP64_EOCD.unpack_from(octets, loc - ZIP64_EOCD.size)
+            if rec[0] != b'PK\x06\x06':
+                raise zipfile.BadZipFile("No Zip64 end of central directory record")
+            self.count = rec[7]
+            cd_size = rec[8]
+            cd_offset = rec[9]
+            cd_end = loc - ZIP64_EOCD.size
+
+        # Data may have been prepended to the Zip file
+        self.concat = cd_end - cd_size - cd_offset
+        if self.concat < 0:
+            raise zipfile.BadZipFile("Bad central directory size or offset")
+        self.cd_start = cd_offset + self.concat
+        self.cd_end = self.cd_start + cd_size
+        if self.cd_end > len(octets):
+            raise zipfile.BadZipFile("Central directory beyond end of file")
+
+        # Walk the directory once up front, so a corrupt one is found
+        # here and not by whoever happens to look something up first
+        self.index = {}
+        for ptr, fname in self.walk():
+            self.entry(ptr, fname)
+            self.index[fname] = ptr
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        yield from self.entries()
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __getitem__(self, name):
+        entry = self.get(name)
+        if entry is None:
+            raise KeyError(name)
+        return entry
+
+    def get(self, name):
+        ''' Look up entry by name '''
+        ptr = self.index.get(name)
+        if ptr is None:
+            return None
+        return self.entry(ptr)
+
+    def walk(self, prefix=None):
+        ''' Yield (offset, filename) of central directory records matching prefix '''
+        octets = self.octets
+        if prefix is not None:
+            bprefix = prefix.encode("utf8")
+            lprefix = len(bprefix)
+        ptr = self.cd_start
+        count = 0
+        while ptr < self.cd_end:
+            if ptr + CENTRAL_DIR.size > self.cd_end:
+                raise zipfile.BadZipFile("Truncated central directory record at 0x%x" % ptr)
+            rec = CENTRAL_DIR.unpack_from(octets, ptr)
+            if rec[0] != b'PK\x01\x02':
+                raise zipfile.BadZipFile("Bad central directory record at 0x%x" % ptr)
+            nptr = ptr + CENTRAL_DIR.size
+            if nptr + rec[12] + rec[13] + rec[14] > self.cd_end:
+                raise zipfile.BadZipFile("Central directory record at 0x%x overruns" % ptr)
+            count += 1
+            if prefix is None or octets[nptr:nptr + lprefix] == bprefix:
+                fname = bytes(octets[nptr:nptr + rec[12]])
+                if rec[5] & 0x800:
+                    fname = fname.decode("utf8")
+                else:
+                    fname = fname.decode("cp437")
+                yield ptr, fname
+            ptr = nptr + rec[12] + rec[13] + rec[14]
+        if count != self.count:
+            raise zipfile.BadZipFile(
+                "Central directory has %d records, not %d" % (count, self.count)
+            )
+
+    def entry(self, ptr, fname=None):
+        ''' Decode the central directory record at ptr '''
+        rec = CENTRAL_DIR.unpack_from(self.octets, ptr)
+        nptr = ptr + CENTRAL_DIR.size
+        if fname is None:
+            fname = bytes(self.octets[nptr:nptr + rec[12]])
+            fname = fname.decode("utf8" if rec[5] & 0x800 else "cp437")
+        entry = ZipEntry()
+        entry.filename = fname
+        entry.flag_bits = rec[5]
+        entry.compress_type = rec[6]
+        entry.CRC = rec[9]
+        entry.compress_size = rec[10]
+        entry.file_size = rec[11]
+        entry.header_offset = rec[18]
+
+        if 0xffffffff in (rec[10], rec[11], rec[18]):
+            xptr = nptr + rec[12]
+            xend = xptr + rec[13]
+            while xptr + 4 <= xend:
+                tag, xlen = struct.unpack_from("<2H", self.octets, xptr)
+                xptr += 4
+                if tag == 0x0001:
+                    need = 8 * sum(x == 0xffffffff for x in (rec[10], rec[11], rec[18]))
+                    if xlen < need or xptr + xlen > xend:
+                        raise zipfile.BadZipFile("Short Zip64 extra field at 0x%x" % ptr)
+                    vals = iter(struct.unpack_from("<%dQ" % (xlen // 8), self.octets, xptr))
+                    if rec[11] == 0xffffffff:
+                        entry.file_size = next(vals)
+                    if rec[10] == 0xffffffff:
+                        entry.compress_size = next(vals)
+                    if rec[18] == 0xffffffff:
+                        entry.header_offset = next(vals)
+                    break
+                xptr += xlen
+
+        entry.header_offset += self.concat
+        return entry
+
+    def entries(self, prefix=None):
+        ''' Lazily yield entries, optionally only those with filenames starting with prefix '''
+        for ptr, fname in self.walk(prefix):
+            yield self.entry(ptr, fname)
+
+    def data_span(self, entry):
+        ''' Return (start, end) offsets of the (compressed) data of an entry '''
+        hdr = LOCAL_HEADER.unpack_from(self.octets, entry.header_offset)
+        if hdr[0] != b'PK\x03\x04':
+            raise zipfile.BadZipFile("Bad local header for " + entry.filename)
+        ptr = entry.header_offset + LOCAL_HEADER.size + hdr[9] + hdr[10]
+        if ptr + entry.compress_size > len(self.octets):
+            raise zipfile.BadZipFile("Truncated member " + entry.filename)
+        return ptr, ptr + entry.compress_size
+
+class ZipMember():
+    '''
+       Streamed reader for one member of a Zip/Bagit file
+
+       Reads straight off the mapped artifact, so every reader has its
+       own position and no state is shared with other readers.
+    '''
+
+    def __init__(self, zipdir, entry):
+        if entry.compress_type == zipfile.ZIP_STORED:
+            self.decomp = None
+        elif entry.compress_type == zipfile.ZIP_DEFLATED:
+            self.decomp = zlib.decompressobj(-15)
+        else:
+            raise NotImplementedError("Compression %d" % entry.compress_type)
+        start, end = zipdir.data_span(entry)
+        self.entry = entry
+        self.data = memoryview(zipdir.octets)[start:end]
+        self.ptr = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.data.release()
+
+    def read(self, size=-1):
+        ''' Read up to size bytes, b'' at end of member '''
+        if size < 0:
+            return b''.join(iter(lambda: self.read(1 << 20), b''))
+        if self.decomp is None:
+            buf = self.data[self.ptr:self.ptr + size].tobytes()
+            self.ptr += len(buf)
+            return buf
+        buf = b''
+        while not buf and not self.decomp.eof:
+            if self.decomp.unconsumed_tail:
+                buf = self.decomp.decompress(self.decomp.unconsumed_tail, size)
+            elif self.ptr < len(self.data):
+                inp = self.data[self.ptr:self.ptr + size]
+                self.ptr += len(inp)
+                buf = self.decomp.decompress(inp, size)
+            else:
+                raise zipfile.BadZipFile("Truncated deflate data in " + self.entry.filename)
+        return buf
@@ -162,6 +162,14 @@ class Format(EnumField):
         has_ext = os.path.splitext(fname.val)
         if has_ext[1].lower() != "." + want_ext:
             yield fname.complaint('BitStore.filename suffix must be ".%s"' % want_ext)
+        artifact = self.sect.metadata.artifact
+        # Streams are not spooled just for this
+        if artifact and artifact.random_access() and not artifact.probe(self.val):
+            # Only then are all the formats needed
+            candidates = artifact.sniff()
+            # Only a proper signature (score ≥ 80) is trusted
+            if candidates and candidates[0][0] >= 80:
+                yield self.complaint('Artifact looks like %s' % candidates[0][1])
 
 class BitStore(Section):
     '''
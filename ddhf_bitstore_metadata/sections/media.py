@@ -211,8 +211,12 @@ class Geometry(Field):
                 yield self.complaint(
                     "Geometry had multiple head-counts (use ranges instead)"
                 )
+        # Formats with structure are checked by their validators instead
+        fmt = self.sect.metadata.BitStore.Format.val
         bitstore_size = self.sect.metadata.BitStore.Size.val
-        if bitstore_size is not None:
+        if bitstore_size is not None and fmt not in (
+            "IMAGEDISK",
+        ):
             bsz = int(bitstore_size)
             gsz = sum(len(x) for x in self.geom)
             if gsz != bsz:
@@ -239,14 +243,3 @@ class Media(Section):
         self += Field("Serial")
         self += Field("Description", single=False)
         self.acceptable_formats(*LEGAL_MEDIA_FORMATS)
-
-    def litany(self, **kwargs):
-        fmt = self.metadata.BitStore.Format.val
-        if fmt in (
-            "IMAGEDISK",
-        ):
-            if self.Geometry.val:
-                yield self.Geometry.complaint(
-                    "Media.Geometry not allowed for %s format" % fmt
-                )
-        yield from super().litany(**kwargs)